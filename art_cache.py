@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bounded_cache import BoundedCache
+import metrics
+
+# Where the downloaded art is kept between runs (shared by every process)
+ART_CACHE_DIR = os.environ.get(
+    "ART_CACHE_DIR", os.path.join("static", "cache", "art")
+)
+# Maximum size of the stored art before the least recently used files are evicted
+ART_CACHE_MAX_BYTES = int(os.environ.get("ART_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# How long (in seconds) a cached file is served without asking the server again
+ART_CACHE_TTL = int(os.environ.get("ART_CACHE_TTL", 7 * 24 * 60 * 60))
+# (connect, read) timeouts in seconds for each art download
+FETCH_TIMEOUT = (5, 30)
+
+
+def _create_session() -> requests.Session:
+    """Create the HTTP session used for every art download.
+    Keep-alive connections are pooled per host and transient errors are retried a bounded number of times.
+    """
+    retries = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",)
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = _create_session()
+
+
+def _blob_path(content_hash: str) -> str:
+    """Get the path of the file holding the content with the given hash.
+    """
+    return os.path.join(ART_CACHE_DIR, "blobs", content_hash)
+
+
+def _index_path(url: str) -> str:
+    """Get the path of the metadata file for the given URL.
+    """
+    url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(ART_CACHE_DIR, "index", url_hash + ".json")
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Write a file so that other processes either see the old file or the complete new one.
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _read_entry(url: str) -> Optional[Dict]:
+    """Load the metadata stored for a URL, if there is any.
+    """
+    try:
+        with open(_index_path(url), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _read_blob(content_hash: str) -> Optional[bytes]:
+    """Load a stored file and mark it as recently used.
+    """
+    path = _blob_path(content_hash)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        # The modification time is used as the last access time for the LRU
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    # Ignore files that were corrupted on disk
+    if hashlib.sha256(content).hexdigest() != content_hash:
+        return None
+    return content
+
+
+def _store(url: str, res: requests.Response, content: bytes) -> None:
+    """Save a downloaded file and its validators to the cache.
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    # Identical content is only stored once, no matter how many URLs point to it
+    if not os.path.exists(_blob_path(content_hash)):
+        _atomic_write(_blob_path(content_hash), content)
+    else:
+        os.utime(_blob_path(content_hash))
+
+    entry = {
+        "url": url,
+        "content_hash": content_hash,
+        "size": len(content),
+        "etag": res.headers.get("ETag"),
+        "last_modified": res.headers.get("Last-Modified"),
+        "validated_at": time.time()
+    }
+    _atomic_write(_index_path(url), json.dumps(entry).encode("utf-8"))
+
+    evict(ART_CACHE_MAX_BYTES)
+
+
+def evict(max_bytes: int) -> None:
+    """Delete the least recently used files until the cache fits in the size limit.
+    """
+    blobs_dir = os.path.join(ART_CACHE_DIR, "blobs")
+    try:
+        names = os.listdir(blobs_dir)
+    except FileNotFoundError:
+        return
+
+    # Collect (last use, size, path) for every stored file
+    blobs = list()
+    for name in names:
+        path = os.path.join(blobs_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Another process evicted it in the meantime
+            continue
+        blobs.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in blobs)
+    # Remove the oldest files first
+    for _, size, path in sorted(blobs):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def fetch_art(url: str) -> bytes:
+    """Get the content of an art URL, downloading it only if the cached copy is missing or stale.
+    Stale copies are revalidated with the stored ETag/Last-Modified headers.
+    """
+    entry = _read_entry(url)
+    content = _read_blob(entry["content_hash"]) if entry is not None else None
+
+    # Fresh copy on disk: no network I/O at all
+    if content is not None and time.time() - entry["validated_at"] < ART_CACHE_TTL:
+        return content
+
+    # Ask the server if the stored copy is still up to date
+    headers = dict()
+    if content is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    res = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+    if res.status_code == 304 and content is not None:
+        # Only refresh the validation time of the existing entry
+        entry["validated_at"] = time.time()
+        _atomic_write(_index_path(url), json.dumps(entry).encode("utf-8"))
+        return content
+
+    res.raise_for_status()
+    content = res.content
+    _store(url, res, content)
+
+    return content
+
+
+# Memory budget for the decoded and processed art layers kept by each process
+LAYER_CACHE_MAX_BYTES = int(os.environ.get("LAYER_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def layer_size(layer: Tuple[Image.Image, List[int]]) -> int:
+    """Estimate the memory used by a layer (image plus drawing coordinates) from its dimensions and number of bands.
+    """
+    img = layer[0]
+    return img.width * img.height * len(img.getbands())
+
+
+# Processed art layers (and decoded source art) shared between renders
+layer_cache = BoundedCache(LAYER_CACHE_MAX_BYTES, layer_size)
+metrics.add_gauges("layer_cache", layer_cache.stats)
@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import Iterable, Tuple
+from PIL import Image, ImageOps
+import utils
+
+# Name of the background used when no custom background is given
+DEFAULT_BACKGROUND = "default"
+
+# Built-in backgrounds: name -> image file
+background_files = {
+    DEFAULT_BACKGROUND: os.path.join("static", "resources", "bg.png")
+}
+
+# Decoded backgrounds, ready to composite: (name, dimensions) -> RGBA image of those dimensions
+# The images are shared between renders, so they must never be modified in place
+_backgrounds = dict()
+_backgrounds_lock = threading.Lock()
+
+
+def register_background(name: str, path: str) -> None:
+    """Add a built-in background (or replace one), from an image file.
+    """
+    with _backgrounds_lock:
+        background_files[name] = path
+        # Drop any version decoded from the previous file
+        for key in [key for key in _backgrounds if key[0] == name]:
+            del _backgrounds[key]
+
+
+def is_background(name: str) -> bool:
+    """Check if a name belongs to a built-in background.
+    """
+    return name in background_files
+
+
+def get_background(name: str, dimensions: Tuple[int, int]) -> Image.Image:
+    """Get a built-in background as an RGBA image covering the given dimensions.
+    The file is only decoded the first time each (background, dimensions) is requested.
+    """
+    key = (name, tuple(dimensions))
+    bg = _backgrounds.get(key)
+    if bg is None:
+        bg = Image.open(background_files[name], mode="r").convert("RGBA")
+        # Scale and crop the background to cover the whole wallpaper
+        if bg.size != key[1]:
+            bg = ImageOps.fit(bg, key[1], utils.RESAMPLE_FILTER)
+        with _backgrounds_lock:
+            _backgrounds[key] = bg
+    return bg
+
+
+def preload_backgrounds(resolutions: Iterable[Tuple[int, int]]) -> None:
+    """Decode every built-in background for each of the given output resolutions, so renders never have to.
+    """
+    for name in list(background_files):
+        for dimensions in resolutions:
+            get_background(name, dimensions)
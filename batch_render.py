@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+import wallpaper_gen
+import utils
+
+DEFAULT_COLOR = "#63B3B0"
+
+
+def safe_filename(name: str) -> str:
+    """Make an operator or art name safe to use as a file/folder name.
+    """
+    return re.sub(r'[\\/:*?"<>|]', "_", name).strip()
+
+
+def list_art_choices(operator: Dict) -> List[Tuple[str, str]]:
+    """List (art name, art URL) for every art available for the operator: Elite 0/1/2 and skins.
+    """
+    choices = [
+        (artwork, operator[artwork])
+        for artwork in ("Elite 0", "Elite 1", "Elite 2")
+        if operator[artwork] != ""
+    ]
+    choices.extend(operator["skins"].items())
+    return choices
+
+
+def create_jobs(
+    dataset: List[Dict],
+    out_dir: str,
+    operator_color: str,
+    img_format: str = "PNG"
+) -> List[Tuple[str, str, str, str]]:
+    """Create a (output path, art URL, color, encoder) job for every operator and art choice.
+    """
+    extension = utils.FILE_EXTENSIONS[utils.get_encoder(img_format)[0]]
+    jobs = list()
+    for operator in dataset:
+        operator_dir = os.path.join(out_dir, safe_filename(operator["name_translated"]))
+        for art_name, art_url in list_art_choices(operator):
+            img_path = os.path.join(operator_dir, safe_filename(art_name) + extension)
+            jobs.append((img_path, art_url, operator_color, img_format))
+    return jobs
+
+
+def render_job(job: Tuple[str, str, str, str]) -> Tuple[str, str]:
+    """Render a single wallpaper (same defaults as the app: chosen art in front, no background art).
+    Returns the output path and an error message (empty if the render succeeded).
+    """
+    img_path, art_url, operator_color, img_format = job
+    try:
+        os.makedirs(os.path.dirname(img_path), exist_ok=True)
+        wip_img = wallpaper_gen.render(art_url, "", "", operator_color)
+        # Write to a temporary file first so an interrupted run never leaves a partial wallpaper behind
+        tmp_path = img_path + ".tmp"
+        utils.save_img(wip_img, tmp_path, img_format)
+        os.replace(tmp_path, img_path)
+    except Exception as e:
+        return (img_path, repr(e))
+
+    return (img_path, "")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pre-generate wallpapers for every operator and art choice in the dataset."
+    )
+    parser.add_argument(
+        "--dataset", default=os.path.join("static", "data", "dataset.json"),
+        help="Path to the operators dataset"
+    )
+    parser.add_argument(
+        "--out-dir", default="wallpapers",
+        help="Folder to write the wallpapers to (one subfolder per operator)"
+    )
+    parser.add_argument(
+        "--color", default=DEFAULT_COLOR,
+        help="Theme color used for every wallpaper"
+    )
+    parser.add_argument(
+        "--format", default="PNG", choices=list(utils.ENCODERS),
+        help="Output encoder (see benchmarks/encoders.py for their speed and file sizes)"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(),
+        help="Number of worker processes (defaults to the number of cores)"
+    )
+    args = parser.parse_args()
+
+    with open(args.dataset, "r") as f:
+        dataset = json.load(f)
+
+    # Resume an interrupted run by skipping wallpapers that already exist
+    jobs = create_jobs(dataset, args.out_dir, args.color, args.format)
+    pending_jobs = [job for job in jobs if not os.path.exists(job[0])]
+    print(f"{len(jobs)} wallpapers, {len(jobs) - len(pending_jobs)} already rendered, {len(pending_jobs)} to go")
+
+    failed_list = list()
+    start = time.perf_counter()
+    # The workers share the downloaded art through the on-disk art cache
+    with Pool(processes=args.processes) as pool:
+        for counter, (img_path, error) in enumerate(pool.imap_unordered(render_job, pending_jobs), start=1):
+            elapsed = time.perf_counter() - start
+            throughput = counter / elapsed
+            if error != "":
+                print(f"FAILED {img_path}: {error}, {datetime.now()}")
+                failed_list.append(img_path)
+            print(f"{counter} / {len(pending_jobs)}: {img_path} ({throughput:.2f} wallpapers/s)")
+
+    print(f"Done in {time.perf_counter() - start:.1f}s, {len(failed_list)} failed")
+
+
+if __name__ == "__main__":
+    main()
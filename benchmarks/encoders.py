@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import time
+# Run from the project root: python benchmarks/encoders.py
+sys.path.insert(0, os.getcwd())
+import utils
+import wallpaper_gen
+from sampling import sample_arts
+
+
+def time_encode(wip_img, img_format: str, repeats: int):
+    """Encode the wallpaper several times with an encoder and return the encoded size and the best time.
+    """
+    best_time = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        img_bytes = utils.encode_img(wip_img, img_format)
+        best_time = min(best_time, time.perf_counter() - start)
+    return len(img_bytes), best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the encode time and file size of the output encoders.")
+    parser.add_argument("--dataset", default=os.path.join("static", "data", "dataset.json"))
+    parser.add_argument("--sample", type=int, default=10, help="Number of operators to render")
+    parser.add_argument("--repeats", type=int, default=3, help="Encodes per operator and encoder (best time is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--color", default="#63B3B0")
+    parser.add_argument(
+        "--dimensions", type=int, nargs=2, default=wallpaper_gen.DIMENSIONS, metavar=("WIDTH", "HEIGHT")
+    )
+    parser.add_argument(
+        "--encoders", nargs="+", default=list(utils.ENCODERS), help="Encoders to compare (see utils.ENCODERS)"
+    )
+    args = parser.parse_args()
+
+    totals = {img_format: [0, 0.0] for img_format in args.encoders}
+    sample = sample_arts(args.dataset, args.sample, args.seed)
+    for name, foreground_art, background_art in sample:
+        # Render once so only the encoding is timed
+        wip_img = wallpaper_gen.render(foreground_art, background_art, "", args.color, args.dimensions)
+
+        results = list()
+        for img_format in args.encoders:
+            size, encode_time = time_encode(wip_img, img_format, args.repeats)
+            totals[img_format][0] += size
+            totals[img_format][1] += encode_time
+            results.append(f"{img_format} {encode_time * 1000:.1f}ms {size / 1024:.0f}KB")
+        print(f"{name}: {', '.join(results)}")
+
+    # Averages per wallpaper, with the size relative to the first encoder
+    reference_size = totals[args.encoders[0]][0]
+    print(f"Average over {len(sample)} wallpapers:")
+    for img_format, (size, encode_time) in totals.items():
+        print(
+            f"  {img_format:<14} {encode_time / len(sample) * 1000:8.1f}ms {size / len(sample) / 1024:8.0f}KB"
+            f" ({size / reference_size:.2f}x the size of {args.encoders[0]})"
+        )
+
+
+if __name__ == "__main__":
+    main()
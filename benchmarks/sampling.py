@@ -0,0 +1,15 @@
+import json
+import random
+
+
+def sample_arts(dataset_path: str, sample_size: int, seed: int):
+    """Pick (operator name, foreground URL, background URL) for a random sample of operators.
+    """
+    with open(dataset_path, "r") as f:
+        dataset = json.load(f)
+    random.seed(seed)
+    operators = random.sample(dataset, min(sample_size, len(dataset)))
+    return [
+        (op["name_translated"], op["Elite 0"], op["Elite 2"])
+        for op in operators
+    ]
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class BoundedCache:
+    """In-memory LRU cache bounded by the total size of its values (as measured by size_fn), with hit/miss counters.
+    Cached values are shared between callers, so they must never be modified in place.
+    """
+    def __init__(self, max_size: int, size_fn: Callable[[Any], int] = lambda value: 1):
+        self.max_size = max_size
+        self.size_fn = size_fn
+        self.current_size = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, its size)
+        self._values = OrderedDict()
+        # Values being created: key -> event set once the creation is over
+        self._creating = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a cached value (None if missing), marking it as the most recently used.
+        """
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._values.move_to_end(key)
+            return entry[0]
+
+    def contains(self, key: Hashable) -> bool:
+        """Check if a value is cached, without touching the counters or its LRU position.
+        """
+        with self._lock:
+            return key in self._values
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache a value, evicting the least recently used ones to stay within the size budget.
+        """
+        size = self.size_fn(value)
+        # Values bigger than the whole budget are not worth keeping
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            if key in self._values:
+                self.current_size -= self._values.pop(key)[1]
+            self._values[key] = (value, size)
+            self.current_size += size
+            while self.current_size > self.max_size:
+                _, (_, evicted_size) = self._values.popitem(last=False)
+                self.current_size -= evicted_size
+
+    def get_or_create(
+        self,
+        key: Hashable,
+        create_fn: Callable[[], Any],
+        while_waiting: Optional[Callable[[], None]] = None
+    ) -> Any:
+        """Get a cached value, or create it with the given function and cache it.
+        Callers missing a value that is already being created wait for it instead of creating it again (and count
+        as hits), calling while_waiting regularly, e.g. to raise if they were cancelled. If that creation fails, one
+        of them creates the value instead.
+        """
+        while True:
+            with self._lock:
+                entry = self._values.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    self._values.move_to_end(key)
+                    return entry[0]
+                creating = self._creating.get(key)
+                if creating is None:
+                    # This caller creates the value
+                    self.misses += 1
+                    creating = threading.Event()
+                    self._creating[key] = creating
+                    break
+            # Look again once the other creation is over (it may have failed, or the value may be too big to cache)
+            while not creating.wait(timeout=0.1):
+                if while_waiting is not None:
+                    while_waiting()
+
+        try:
+            value = create_fn()
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._creating[key]
+            creating.set()
+
+    def clear(self) -> None:
+        """Remove every cached value.
+        """
+        with self._lock:
+            self._values.clear()
+            self.current_size = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups > 0 else 0.0,
+                "entries": len(self._values),
+                "size": self.current_size
+            }
@@ -0,0 +1,19 @@
+from typing import List, Tuple, Union
+from PIL import Image
+
+# A layer is drawn as (source image or color, top-left coordinates, mask image whose alpha is used or L mask)
+Layer = Tuple[Union[Image.Image, str], List[int], Image.Image]
+
+
+def composite(base: Image.Image, layers: List[Layer]) -> Image.Image:
+    """Draw the layers, in order, on top of a copy of the base image, with one PIL paste per layer.
+    """
+    wip_img = base.copy()
+    for source, coords, mask in layers:
+        if isinstance(source, str):
+            # Solid color layers are filled through the mask, no need to create an image for them
+            wip_img.paste(source, (coords[0], coords[1], coords[0] + mask.width, coords[1] + mask.height), mask=mask)
+        else:
+            wip_img.paste(source, tuple(coords), mask=mask)
+
+    return wip_img
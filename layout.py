@@ -0,0 +1,63 @@
+from functools import lru_cache
+from typing import Tuple
+
+# Every element of the wallpaper is placed in units relative to the output dimensions.
+# The values were derived from the original 640x1280 design, which they reproduce exactly.
+
+# Side of the square operator art, relative to the wallpaper width (1024 / 640)...
+ART_WIDTH_RATIO = 1.6
+# ...and capped relative to the wallpaper height (1024 / 1280) for wide screens
+ART_HEIGHT_RATIO = 0.8
+# How much bigger than the foreground art the background art is drawn
+BG_ART_SCALE = 1.05
+# Vertical position of the background art, relative to the wallpaper height (-100 / 1280)
+BG_ART_Y_RATIO = -0.078125
+# Offset of the art shadows, relative to the wallpaper width (15 / 640)
+SHADOW_OFFSET_RATIO = 0.0234375
+# Footer polygon corners as (x, y) fractions of the wallpaper width and height
+FOOTER_POLYGON = [(0, 0.859375), (1, 0.78125), (1, 1), (0, 1)]
+
+# Output resolutions offered in the app (width, height)
+DEVICE_RESOLUTIONS = {
+    "640x1280 (default)": (640, 1280),
+    "1080x2400 (FHD+ phone)": (1080, 2400),
+    "1440x3200 (QHD+ phone)": (1440, 3200),
+    "1600x2560 (tablet)": (1600, 2560)
+}
+
+
+class Layout:
+    """Pixel positions and sizes of the wallpaper elements for a given output resolution.
+    """
+    def __init__(self, dimensions: Tuple[int, int]):
+        width, height = dimensions
+        self.dimensions = (width, height)
+        # The art is resampled straight to these sizes, so the cost scales with the output resolution
+        self.art_size = int(min(width * ART_WIDTH_RATIO, height * ART_HEIGHT_RATIO))
+        self.bg_art_size = int(self.art_size * BG_ART_SCALE)
+        self.bg_art_y = round(height * BG_ART_Y_RATIO)
+        self.shadow_offset = round(width * SHADOW_OFFSET_RATIO)
+        self.footer_polygon = [
+            (round(x * width), round(y * height))
+            for x, y in FOOTER_POLYGON
+        ]
+
+    def __repr__(self):
+        return f"Layout({self.dimensions[0]}x{self.dimensions[1]})"
+
+
+def scale_to_width(dimensions: Tuple[int, int], width: int) -> Tuple[int, int]:
+    """Scale output dimensions to the given width, keeping their aspect ratio (and so the same layout).
+    """
+    return width, round(width * dimensions[1] / dimensions[0])
+
+
+@lru_cache(maxsize=16)
+def _cached_layout(width: int, height: int) -> Layout:
+    return Layout((width, height))
+
+
+def get_layout(dimensions: Tuple[int, int]) -> Layout:
+    """Get the (cached) layout for the given output dimensions (any (width, height) sequence).
+    """
+    return _cached_layout(int(dimensions[0]), int(dimensions[1]))
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+# Upper bounds (in seconds) of the histogram buckets exported to Prometheus
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Recent timings kept per stage to calculate the percentiles of the log line
+SAMPLE_SIZE = 2048
+PERCENTILES = (50, 95, 99)
+# Start the Prometheus endpoint on this port, and/or print the log line every this many seconds (off if not set)
+METRICS_PORT = os.environ.get("WALLPAPER_METRICS_PORT")
+METRICS_LOG_INTERVAL = os.environ.get("WALLPAPER_METRICS_LOG_INTERVAL")
+
+# Functions called with (stage name, seconds) every time a stage finishes
+hooks: List[Callable[[str, float], None]] = list()
+# Functions returning the current values (name -> number) of a group of gauges, e.g. cache counters, by group
+gauges: Dict[str, Callable[[], Dict[str, float]]] = dict()
+
+
+def add_hook(hook: Callable[[str, float], None]) -> None:
+    """Call a function with (stage name, seconds) every time a render stage finishes.
+    """
+    hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[str, float], None]) -> None:
+    """Stop calling a function added with add_hook.
+    """
+    hooks.remove(hook)
+
+
+def add_gauges(group: str, read_fn: Callable[[], Dict[str, float]]) -> None:
+    """Export the values returned by a function (name -> number) as the gauges wallpaper_<group>_<name>,
+    read every time the metrics are exported.
+    """
+    gauges[group] = read_fn
+
+
+def gauges_prometheus_text() -> str:
+    """Export the current value of every gauge in the Prometheus text format.
+    """
+    lines = list()
+    for group, read_fn in sorted(gauges.items()):
+        for name, value in read_fn().items():
+            lines.append(f"# TYPE wallpaper_{group}_{name} gauge")
+            lines.append(f"wallpaper_{group}_{name} {value}")
+    return "\n".join(lines) + "\n" if len(lines) > 0 else ""
+
+
+def gauges_summary_line() -> str:
+    """Format the current value of every gauge as a single log line.
+    """
+    groups = [
+        f"{group} " + " ".join(f"{name}={value:.3g}" for name, value in read_fn().items())
+        for group, read_fn in sorted(gauges.items())
+    ]
+    return "gauges: " + ", ".join(groups)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the code block as a render stage and report it to every hook (even if the block raises).
+    """
+    if len(hooks) == 0:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for hook in hooks:
+            hook(name, elapsed)
+
+
+class StageHistograms:
+    """Aggregates the stage timings: a cumulative histogram per stage (for Prometheus) and its most recent
+    timings (for percentiles).
+    """
+    def __init__(self, buckets=BUCKETS, sample_size: int = SAMPLE_SIZE):
+        self.buckets = buckets
+        self.sample_size = sample_size
+        self._stages = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a stage timing (usable as a hook).
+        """
+        with self._lock:
+            stage_data = self._stages.get(name)
+            if stage_data is None:
+                stage_data = {
+                    "bucket_counts": [0] * len(self.buckets),
+                    "count": 0,
+                    "sum": 0.0,
+                    "samples": deque(maxlen=self.sample_size)
+                }
+                self._stages[name] = stage_data
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stage_data["bucket_counts"][i] += 1
+            stage_data["count"] += 1
+            stage_data["sum"] += seconds
+            stage_data["samples"].append(seconds)
+
+    def percentiles(self) -> Dict[str, Dict[int, float]]:
+        """Get the p50/p95/p99 (in seconds) of the recent timings of each stage.
+        """
+        with self._lock:
+            samples = {name: sorted(stage_data["samples"]) for name, stage_data in self._stages.items()}
+        return {
+            name: {
+                percentile: stage_samples[min(len(stage_samples) - 1, len(stage_samples) * percentile // 100)]
+                for percentile in PERCENTILES
+            }
+            for name, stage_samples in samples.items()
+        }
+
+    def summary_line(self) -> str:
+        """Format the stage percentiles (in milliseconds) as a single log line.
+        """
+        stages = [
+            f"{name} " + "/".join(f"{value * 1000:.1f}" for value in stage_percentiles.values())
+            for name, stage_percentiles in sorted(self.percentiles().items())
+        ]
+        labels = "/".join(f"p{percentile}" for percentile in PERCENTILES)
+        return f"render stages ({labels} ms): " + ", ".join(stages)
+
+    def prometheus_text(self) -> str:
+        """Export the histograms in the Prometheus text format.
+        """
+        lines = [
+            "# HELP wallpaper_stage_seconds Time spent in each stage of the wallpaper render pipeline.",
+            "# TYPE wallpaper_stage_seconds histogram"
+        ]
+        with self._lock:
+            for name, stage_data in sorted(self._stages.items()):
+                for bound, count in zip(self.buckets, stage_data["bucket_counts"]):
+                    lines.append(f'wallpaper_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'wallpaper_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage_data["count"]}')
+                lines.append(f'wallpaper_stage_seconds_sum{{stage="{name}"}} {stage_data["sum"]}')
+                lines.append(f'wallpaper_stage_seconds_count{{stage="{name}"}} {stage_data["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+# Timings of every stage rendered by this process
+histograms = StageHistograms()
+add_hook(histograms.observe)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = (histograms.prometheus_text() + gauges_prometheus_text()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Don't log every scrape
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the stage histograms and the gauges at http://host:port/metrics (Prometheus text format) from a background thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_summary_logger(interval: float) -> None:
+    """Print the stage percentiles line (and the gauges line) every interval seconds from a background thread.
+    """
+    def log_summaries():
+        while True:
+            time.sleep(interval)
+            print(histograms.summary_line(), flush=True)
+            if len(gauges) > 0:
+                print(gauges_summary_line(), flush=True)
+
+    threading.Thread(target=log_summaries, daemon=True).start()
+
+
+def start_from_env() -> None:
+    """Start the Prometheus endpoint and/or the log line, as configured by WALLPAPER_METRICS_PORT and
+    WALLPAPER_METRICS_LOG_INTERVAL.
+    """
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    if METRICS_LOG_INTERVAL:
+        start_summary_logger(float(METRICS_LOG_INTERVAL))
@@ -0,0 +1,36 @@
+import json
+import os
+from typing import Dict, List
+
+DATASET_PATH = os.path.join("static", "data", "dataset.json")
+
+
+class OperatorRegistry:
+    """Operator dataset loaded once, with indexes by rarity and by name for constant time lookups.
+    """
+    def __init__(self, dataset_path: str = DATASET_PATH):
+        with open(dataset_path, "r") as f:
+            dataset = json.load(f)
+
+        # Operators sorted by name, as they are listed in the app
+        dataset.sort(key=lambda operator: operator["name_translated"])
+
+        # Map each operator name to its details
+        self.by_name = dict()
+        # Map each rarity (number of stars) to the sorted names of its operators
+        self.by_rarity = {star: list() for star in range(1, 7)}
+        for operator in dataset:
+            # The rarity is scraped as a string
+            operator["rarity"] = int(operator["rarity"])
+            self.by_name[operator["name_translated"]] = operator
+            self.by_rarity[operator["rarity"]].append(operator["name_translated"])
+
+    def names_by_rarity(self, rarity: int) -> List[str]:
+        """Get the sorted names of the operators with the given rarity.
+        """
+        return self.by_rarity.get(rarity, [])
+
+    def get(self, name: str) -> Dict:
+        """Get the details of an operator by name.
+        """
+        return self.by_name[name]
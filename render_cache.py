@@ -0,0 +1,119 @@
+import hashlib
+import os
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple, Union
+from PIL import Image
+import utils
+import wallpaper_gen
+import backgrounds
+import render_scheduler
+import metrics
+from bounded_cache import BoundedCache
+
+# Memory budget for the encoded wallpapers shared by every session of the process
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# Encoded wallpapers, bounded by their size in bytes
+render_cache = BoundedCache(RENDER_CACHE_MAX_BYTES, len)
+metrics.add_gauges("render_cache", render_cache.stats)
+
+
+def hash_background(wallpaper_bg: Union[str, Image.Image]) -> str:
+    """Hash the content of a custom background, given as an image file or an image in memory
+    (empty string for the default background, and the name for the other built-in backgrounds).
+    """
+    if isinstance(wallpaper_bg, Image.Image):
+        # Uploaded backgrounds come with the hash of their content (see utils.load_custom_bg)
+        if utils.CUSTOM_BG_HASH_KEY in wallpaper_bg.info:
+            return wallpaper_bg.info[utils.CUSTOM_BG_HASH_KEY]
+        bg_hash = hashlib.sha256(f"{wallpaper_bg.mode}{wallpaper_bg.size}".encode("utf-8"))
+        bg_hash.update(wallpaper_bg.tobytes())
+        return bg_hash.hexdigest()
+    if wallpaper_bg == "":
+        return ""
+    if backgrounds.is_background(wallpaper_bg):
+        return f"builtin:{wallpaper_bg}"
+    with open(wallpaper_bg, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def render_key(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    img_format: str = "PNG",
+    dimensions: Tuple[int, int] = wallpaper_gen.DIMENSIONS
+) -> Tuple:
+    """Create the render cache key of a wallpaper.
+    """
+    return (
+        foreground_art,
+        background_art,
+        operator_color.lower(),
+        hash_background(wallpaper_bg),
+        tuple(dimensions),
+        img_format
+    )
+
+
+def is_cached(*args, **kwargs) -> bool:
+    """Check if a wallpaper (same arguments as render_bytes_cached) is already in the render cache.
+    """
+    return render_cache.contains(render_key(*args, **kwargs))
+
+
+def render_bytes_cached(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    img_format: str = "PNG",
+    dimensions: Tuple[int, int] = wallpaper_gen.DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> bytes:
+    """Same as wallpaper_gen.render_bytes, but served from the shared render cache when the same wallpaper
+    was already created (by any session). Only cache misses go through the render scheduler, a wallpaper
+    already being rendered is waited for instead of rendered again, and cancelled renders are not cached.
+    """
+    key = render_key(foreground_art, background_art, wallpaper_bg, operator_color, img_format, dimensions)
+    return render_cache.get_or_create(
+        key,
+        lambda: render_scheduler.render_bytes_scheduled(
+            foreground_art, background_art, wallpaper_bg, operator_color, img_format, dimensions, is_cancelled
+        ),
+        lambda: wallpaper_gen.check_cancelled(is_cancelled)
+    )
+
+
+def submit_render_cached(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    img_format: str = "PNG",
+    dimensions: Tuple[int, int] = wallpaper_gen.DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> Future:
+    """Same as render_bytes_cached, but in the background: a cached wallpaper is returned as a finished future,
+    otherwise the render is queued by the render scheduler straight away (RenderRejected is raised here if the
+    queue is full) and runs on the scheduler's threads.
+    """
+    key = render_key(foreground_art, background_art, wallpaper_bg, operator_color, img_format, dimensions)
+    img_bytes = render_cache.get(key) if render_cache.contains(key) else None
+    if img_bytes is not None:
+        future = Future()
+        future.set_result(img_bytes)
+        return future
+
+    return render_scheduler.scheduler.submit(
+        render_scheduler.estimate_render_bytes(dimensions),
+        lambda: render_cache.get_or_create(
+            key,
+            lambda: wallpaper_gen.render_bytes(
+                foreground_art, background_art, wallpaper_bg, operator_color, img_format, dimensions, is_cancelled
+            ),
+            lambda: wallpaper_gen.check_cancelled(is_cancelled)
+        ),
+        is_cancelled
+    )
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple, Union
+from PIL import Image
+from layout import get_layout
+import wallpaper_gen
+
+# Memory the renders running at the same time may use together
+RENDER_MEMORY_BUDGET = int(os.environ.get("RENDER_MEMORY_BUDGET", 512 * 1024 * 1024))
+# Renders allowed to wait for memory; any more are rejected straight away
+RENDER_QUEUE_LIMIT = int(os.environ.get("RENDER_QUEUE_LIMIT", 32))
+# Seconds a render may wait (from its submission) before it is rejected
+RENDER_QUEUE_TIMEOUT = float(os.environ.get("RENDER_QUEUE_TIMEOUT", 30))
+# Renders running at the same time, one more than the cores so a quick preview can run next to a full render
+RENDER_MAX_RUNNING = int(os.environ.get("RENDER_MAX_RUNNING", os.cpu_count() + 1))
+
+
+class RenderRejected(Exception):
+    """Raised when a render can't be admitted: the queue is full or it waited too long.
+    """
+
+
+def estimate_render_bytes(dimensions: Tuple[int, int]) -> int:
+    """Estimate the peak memory used by a render at the given output dimensions.
+    """
+    layout = get_layout(dimensions)
+    # RGBA buffers (4 bytes per pixel) the size of the wallpaper: working image, background, composited copy
+    # and the encoder's copy
+    canvas_bytes = 4 * dimensions[0] * dimensions[1] * 4
+    # Fore and background art layers, plus the decoded source art being resized into them
+    art_bytes = 2 * (layout.art_size ** 2 + layout.bg_art_size ** 2) * 4
+    return canvas_bytes + art_bytes
+
+
+class RenderScheduler:
+    """Admits renders in arrival order while their estimated memory fits in the budget and fewer than max_running
+    renders are running; the rest wait in a bounded queue.
+    """
+    def __init__(self, memory_budget: int, queue_limit: int, queue_timeout: float, max_running: int):
+        self.memory_budget = memory_budget
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.max_running = max_running
+        self.bytes_in_use = 0
+        self.running = 0
+        self.rejected = 0
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._queue = deque()
+        self._condition = threading.Condition()
+
+    def _enqueue(self) -> Tuple[object, float]:
+        """Take a place in the queue, raising RenderRejected if it is full.
+        Returns the ticket of the render and the time its wait started.
+        """
+        with self._condition:
+            if len(self._queue) >= self.queue_limit:
+                self.rejected += 1
+                raise RenderRejected(f"Render queue is full ({len(self._queue)} waiting)")
+            ticket = object()
+            self._queue.append(ticket)
+            return ticket, time.perf_counter()
+
+    @contextmanager
+    def _hold(self, ticket: object, start: float, cost: int, is_cancelled: Optional[Callable[[], bool]]):
+        """Wait until the queued render can run, and hold its memory while the block runs.
+        """
+        # A render bigger than the whole budget can still run, alone
+        cost = min(cost, self.memory_budget)
+        with self._condition:
+            try:
+                # Only the oldest waiting render may start, so big renders are not starved by small ones
+                while (
+                    self._queue[0] is not ticket
+                    or self.bytes_in_use + cost > self.memory_budget
+                    or self.running >= self.max_running
+                ):
+                    waited = time.perf_counter() - start
+                    if waited >= self.queue_timeout:
+                        self.rejected += 1
+                        raise RenderRejected(f"Render waited {waited:.1f}s to start")
+                    wallpaper_gen.check_cancelled(is_cancelled)
+                    # Wake up regularly to check the timeout and cancellation
+                    self._condition.wait(timeout=0.1)
+            finally:
+                self._queue.remove(ticket)
+                # The next render in the queue may be able to start now
+                self._condition.notify_all()
+
+            wait = time.perf_counter() - start
+            self.bytes_in_use += cost
+            self.running += 1
+            self.admitted += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.bytes_in_use -= cost
+                self.running -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost: int, is_cancelled: Optional[Callable[[], bool]] = None):
+        """Wait until a render with the given memory cost can run, and hold its memory while the block runs.
+        Raises RenderRejected if the queue is full or the wait times out, and wallpaper_gen.RenderCancelled if the
+        render is cancelled while waiting.
+        """
+        ticket, start = self._enqueue()
+        with self._hold(ticket, start, cost, is_cancelled):
+            yield
+
+    def submit(
+        self,
+        cost: int,
+        render_fn: Callable[[], bytes],
+        is_cancelled: Optional[Callable[[], bool]] = None
+    ) -> Future:
+        """Queue a render straight away and run it on its own thread once admitted (see admit), so every waiting
+        render is seen by the queue limit, the timeout and the counters from the moment it is submitted.
+        Raises RenderRejected if the queue is full; the other errors are raised by the future's result().
+        """
+        ticket, start = self._enqueue()
+        future = Future()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            try:
+                with self._hold(ticket, start, cost, is_cancelled):
+                    result = render_fn()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        # At most queue_limit + max_running of these threads exist at the same time
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def stats(self) -> Dict:
+        """Get the scheduler counters: queue depth, memory in use and wait times.
+        """
+        with self._condition:
+            return {
+                "queue_depth": len(self._queue),
+                "running": self.running,
+                "bytes_in_use": self.bytes_in_use,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "mean_wait": self.total_wait / self.admitted if self.admitted > 0 else 0.0,
+                "max_wait": self.max_wait
+            }
+
+
+scheduler = RenderScheduler(RENDER_MEMORY_BUDGET, RENDER_QUEUE_LIMIT, RENDER_QUEUE_TIMEOUT, RENDER_MAX_RUNNING)
+
+
+def render_bytes_scheduled(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    img_format: str = "PNG",
+    dimensions: Tuple[int, int] = wallpaper_gen.DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> bytes:
+    """Same as wallpaper_gen.render_bytes, but only runs once the scheduler admits it.
+    """
+    with scheduler.admit(estimate_render_bytes(dimensions), is_cancelled):
+        return wallpaper_gen.render_bytes(
+            foreground_art, background_art, wallpaper_bg, operator_color, img_format, dimensions, is_cancelled
+        )
@@ -0,0 +1,80 @@
+import json
+import os
+from typing import Dict, List
+
+
+class DatasetCheckpoint:
+    def __init__(self, path: str):
+        """
+        Append-only JSON Lines checkpoint of the scraped operators, so an interrupted scrape can be resumed
+        Args:
+            path: Checkpoint file, loaded if it already exists
+        """
+        self.path = path
+        # Map each operator (original name) to its latest scraped details
+        self.records: Dict[str, Dict] = dict()
+        self.load()
+
+    def load(self):
+        """
+        Load the records committed by a previous run, dropping a partially written last line
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "rb") as f:
+            content = f.read()
+
+        committed_bytes = 0
+        for line in content.splitlines(keepends=True):
+            # A commit is only complete once its line, newline included, was written
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self.records[record["original_name"]] = record
+            committed_bytes += len(line)
+
+        # Cut the torn tail, so the next commit starts on a fresh line
+        if committed_bytes < len(content):
+            with open(self.path, "r+b") as f:
+                f.truncate(committed_bytes)
+
+    def commit(self, record: Dict):
+        """
+        Append the details of a scraped operator, only returning once they are on disk
+        Args:
+            record: Operator details
+        """
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        # A single write of a whole line: a crash can only leave a partial last line, which load() drops
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[record["original_name"]] = record
+
+    def clear(self):
+        """
+        Discard every record, e.g. to start a fresh scrape
+        """
+        self.records = dict()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def compact(self, dataset_path: str, operators_list: List[Dict]):
+        """
+        Write the final dataset atomically (readers never see a partial file) and remove the checkpoint
+        Args:
+            dataset_path: Dataset file to write
+            operators_list: Operator details to write, usually merged from the checkpoint records
+        """
+        tmp_path = dataset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(operators_list, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, dataset_path)
+        self.clear()
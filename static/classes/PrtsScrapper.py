@@ -16,6 +16,7 @@ logging.basicConfig(level=logging.INFO)
 class PrtsScrapper:
     def __init__(self):
         self.prts_base_url = "https://prts.wiki/w/"
+        self.prts_api_url = "https://prts.wiki/api.php"
         # Get list of operators' header html
         self.operators_base_html_list = self.get_operators_base_html()
         self.num_operators_available = len(self.operators_base_html_list)
@@ -72,6 +73,62 @@ class PrtsScrapper:
 
         return operators_dict
     
+    def get_page_title(self, operator_name):
+        """
+        Get the wiki page title of an operator (the end of their page URL).
+        """
+        return self.operators_url_dict[operator_name]["url"][len(self.prts_base_url):]
+
+    def query_pages(self, titles, **params):
+        """
+        Query the wiki API about a list of pages, 50 titles per request (the API limit).
+        Returns a dictionary mapping each title, as given, to its page info.
+        """
+        pages = dict()
+        for i in range(0, len(titles), 50):
+            batch = titles[i:i + 50]
+            req = requests.get(
+                self.prts_api_url,
+                params={
+                    "action": "query",
+                    "titles": "|".join(batch),
+                    "format": "json",
+                    "formatversion": 2,
+                    **params
+                },
+                timeout=30
+            )
+            req.raise_for_status()
+            query = req.json()["query"]
+            # The API may return the titles normalized (e.g. spaces, namespace aliases)
+            normalized = {entry["to"]: entry["from"] for entry in query.get("normalized", [])}
+            for page in query["pages"]:
+                pages[normalized.get(page["title"], page["title"])] = page
+        return pages
+
+    def get_page_revisions(self, operator_names):
+        """
+        Get dictionary mapping operators to the current revision id of their page.
+        """
+        titles = {self.get_page_title(name): name for name in operator_names}
+        pages = self.query_pages(list(titles), prop="revisions", rvprop="ids")
+        return {
+            titles[title]: page["revisions"][0]["revid"]
+            for title, page in pages.items()
+            if title in titles and "revisions" in page
+        }
+
+    def get_existing_files(self, filenames):
+        """
+        Get the set of file names (without the namespace) that exist in the wiki.
+        """
+        pages = self.query_pages([f"File:{filename}" for filename in filenames])
+        return {
+            title[len("File:"):]
+            for title, page in pages.items()
+            if not page.get("missing", False)
+        }
+
     def write_pickle(self):
         with open("operator_pages.pickle", "wb") as f:
             pickle.dump(self.operators_url_dict, f)
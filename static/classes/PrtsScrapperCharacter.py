@@ -16,20 +16,68 @@ import re
 from requests_html import HTMLSession
 # Local imports
 from classes.PrtsScrapper import PrtsScrapper
-from classes.WebScraper import WebScraper
+from classes.WebScraper import WebScraper, BrowserPool
 
 
 class PrtsScrapperCharacter:
-    def __init__(self, operator_name, operator_name_cn, operator_url):
+    def __init__(self, operator_name, operator_name_cn, operator_url, browser_pool: BrowserPool = None, load: bool = True):
         self.name = operator_name
         self.name_cn = operator_name_cn
         self.page_url = operator_url
-        self.operator_details = self.load_operator_details()
+        # Reuse the pages of an already running browser if given, otherwise launch one just for this operator
+        self.browser_pool = browser_pool
+        # The async scraper loads the details later, with load_operator_details_async
+        if load:
+            self.operator_details = self.load_operator_details()
 
     def load_operator_details(self):
         """
         Navigate to an operator page, extract their details and return as a dict
         """
+        # Scrape all required details
+        if self.browser_pool is not None:
+            scraper_context = self.browser_pool.scraper()
+        else:
+            scraper_context = WebScraper()
+        with scraper_context as scraper:
+            scraper.navigate(self.page_url)
+            # Click english language button (reloads page)
+
+            # Get the english-translated character name
+            char_name = scraper.page.locator("#firstHeading").text_content()
+
+            char_info = scraper.page.locator(".charinfo-container")
+            # # Debug only
+            # char_info_html = char_info.evaluate("el => el.outerHTML")
+            # print(char_info_html)
+
+            # Find the img element with a src attribute for the rarity image url
+            rarity_url = char_info.locator("div.charstar").locator("img").get_attribute("src")
+            # Number of elite stages and skins with their own artwork
+            elite_stages = len(char_info.locator(".stage-btn-wrapper").evaluate("div => div.childNodes"))
+            skin_count = len(char_info.locator(".charlogo-skin").evaluate("div => div.childNodes"))
+
+        return self.build_operator_details(char_name, rarity_url, elite_stages, skin_count)
+
+    async def load_operator_details_async(self, page):
+        """
+        Same as load_operator_details, but with a page of the Playwright async API (e.g. from an AsyncBrowserPool)
+        """
+        await page.goto(self.page_url, wait_until="networkidle")
+
+        char_name = await page.locator("#firstHeading").text_content()
+        char_info = page.locator(".charinfo-container")
+        rarity_url = await char_info.locator("div.charstar").locator("img").get_attribute("src")
+        elite_stages = len(await char_info.locator(".stage-btn-wrapper").evaluate("div => div.childNodes"))
+        skin_count = len(await char_info.locator(".charlogo-skin").evaluate("div => div.childNodes"))
+
+        self.operator_details = self.build_operator_details(char_name, rarity_url, elite_stages, skin_count)
+        return self.operator_details
+
+    def build_operator_details(self, char_name: str, rarity_url: str, elite_stages: int, skin_count: int) -> Dict:
+        """
+        Build the operator details dict from the values scraped from their page
+        """
         operator_details_dict = {
             "original_name": self.name,
             "url": self.page_url
@@ -47,63 +95,46 @@ class PrtsScrapperCharacter:
         # atk_interval
         # limited
 
-        # Scrape all required details
-        with WebScraper() as scraper:
-            scraper.navigate(self.page_url)
-            # Click english language button (reloads page)
+        self.name_translated = char_name
+        # Can be issues where name gets displayed back in chinese, so keep the original name if its in english
+        # i.e. the name uses ascii compatible characters (avoid russian and chinese at least)
+        if self.name_translated.isascii():
+            operator_details_dict["name_translated"] = self.name_translated
+        else:
+            operator_details_dict["name_translated"] = self.name
+
+        # And extract the rarity via regex matching on the file name
+        rarity_pattern = r'star_(\d+)\.png$'
+        # Group 1 being the numeric value in the file name
+        rarity_value = re.search(rarity_pattern, rarity_url).group(1)
+        operator_details_dict["rarity"] = rarity_value
+
+        # Calculate elite 0 and 2 artwork url
+        elite1_filename = f"立绘_{self.name_cn}_1.png"
+        elite0_url = f"https://media.prts.wiki/{self.get_path(elite1_filename)}"
+        if elite_stages > 1:
+            elite2_filename = f"立绘_{self.name_cn}_2.png"
+            elite2_url = f"https://media.prts.wiki/{self.get_path(elite2_filename)}"
+        else:
+            elite2_url = ""
+        # Only affects base Amiya for now
+        if self.name_cn == "阿米娅":
+            operator_details_dict["Elite 1"] = "https://media.prts.wiki/3/34/%E7%AB%8B%E7%BB%98_%E9%98%BF%E7%B1%B3%E5%A8%85_1%2B.png"
+        else:
+            operator_details_dict["Elite 1"] = ""
 
-            # Get the english-translated character name
-            char_name = scraper.page.locator("#firstHeading")
-            self.name_translated = char_name.text_content()
-            # Can be issues where name gets displayed back in chinese, so keep the original name if its in english
-            # i.e. the name uses ascii compatible characters (avoid russian and chinese at least)
-            if self.name_translated.isascii():
-                operator_details_dict["name_translated"] = self.name_translated
-            else:
-                operator_details_dict["name_translated"] = self.name
+        operator_details_dict["Elite 0"] = elite0_url
+        operator_details_dict["Elite 2"] = elite2_url
 
-            char_info = scraper.page.locator(".charinfo-container")
-            # # Debug only
-            # char_info_html = char_info.evaluate("el => el.outerHTML")
-            # print(char_info_html)
+        # Calculate skins url
+        skins_dict = dict()
+        for skin in range(skin_count):
+            skin_name = f"skin{skin + 1}"
+            skin_filename = f"立绘_{self.name_cn}_{skin_name}.png"
+            skin_url = f"https://media.prts.wiki/{self.get_path(skin_filename)}"
+            skins_dict[f"Skin {skin + 1}"] = skin_url
+        operator_details_dict["skins"] = skins_dict
 
-            # Find the img element with a src attribute for the rarity image url
-            rarity_url = char_info.locator("div.charstar").locator("img").get_attribute("src")
-            # And extract the rarity via regex matching on the file name
-            rarity_pattern = r'star_(\d+)\.png$'
-            # Group 1 being the numeric value in the file name
-            rarity_value = re.search(rarity_pattern, rarity_url).group(1)
-            operator_details_dict["rarity"] = rarity_value
-
-            # Calculate elite 0 and 2 artwork url
-            elite_info = char_info.locator(".stage-btn-wrapper").evaluate("div => div.childNodes")
-            elite_stages = len(elite_info)
-            elite1_filename = f"立绘_{self.name_cn}_1.png"
-            elite0_url = f"https://media.prts.wiki/{self.get_path(elite1_filename)}"
-            if elite_stages > 1:
-                elite2_filename = f"立绘_{self.name_cn}_2.png"
-                elite2_url = f"https://media.prts.wiki/{self.get_path(elite2_filename)}"
-            else:
-                elite2_url = ""
-            # Only affects base Amiya for now
-            if self.name_cn == "阿米娅":
-                operator_details_dict["Elite 1"] = "https://media.prts.wiki/3/34/%E7%AB%8B%E7%BB%98_%E9%98%BF%E7%B1%B3%E5%A8%85_1%2B.png"
-            else:
-                operator_details_dict["Elite 1"] = ""
-
-            operator_details_dict["Elite 0"] = elite0_url
-            operator_details_dict["Elite 2"] = elite2_url
-
-            # Calculate skins url
-            skin_info = char_info.locator(".charlogo-skin").evaluate("div => div.childNodes")
-            skins_dict = dict()
-            for skin in range(len(skin_info)):
-                skin_name = f"skin{skin + 1}"
-                skin_filename = f"立绘_{self.name_cn}_{skin_name}.png"
-                skin_url = f"https://media.prts.wiki/{self.get_path(skin_filename)}"
-                skins_dict[f"Skin {skin + 1}"] = skin_url
-            operator_details_dict["skins"] = skins_dict
-            
         # Add up remaining operator details as class attributs
         self.elite0 = operator_details_dict["Elite 0"]
         self.elite1 = operator_details_dict["Elite 1"]
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Token bucket: allows rate requests per second on average, in bursts of up to capacity requests
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens saved up
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        """
+        Add the tokens earned since the last update
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it
+        """
+        # Waiters are served one at a time, in order
+        async with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+
+class HostRateLimiter:
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        One token bucket per host, so every site is rate limited independently
+        Args:
+            rate: Requests per second allowed for each host
+            capacity: Burst size allowed for each host
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[str, TokenBucket] = dict()
+
+    async def acquire(self, url: str):
+        """
+        Wait until a request to the url's host is allowed
+        Args:
+            url: URL about to be requested
+        """
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        await self.buckets[host].acquire()
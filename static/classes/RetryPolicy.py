@@ -0,0 +1,74 @@
+import random
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 4, base_delay: float = 5, max_delay: float = 300):
+        """
+        Limited number of attempts per scrape, with exponential backoff and full jitter between them
+        Args:
+            max_attempts: Attempts per operator before giving up on it
+            base_delay: Maximum delay (seconds) after the first failure, doubled after every other failure
+            max_delay: Cap on the delay (seconds)
+        """
+        if max_attempts < 1:
+            raise ValueError(f"At least one attempt is needed per scrape, got {max_attempts}")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """
+        Seconds to wait after a failed attempt
+        Args:
+            attempt: Number of the attempt that failed, starting at 1
+        Returns:
+            Random delay between 0 and the exponential backoff, so retries don't all hit the host at the same time
+        """
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, backoff)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 300):
+        """
+        Per-host circuit breaker: after too many consecutive failures on a host, stop sending it requests for a while
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            cooldown: Seconds the circuit stays open before a request is tried again
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures: Dict[str, int] = dict()
+        self.opened_at: Dict[str, float] = dict()
+
+    def wait_time(self, url: str) -> float:
+        """
+        Seconds to wait before a request to the url's host is allowed (0 if the circuit is closed or the cooldown is over)
+        """
+        host = urlparse(url).netloc
+        if host not in self.opened_at:
+            return 0
+        return max(0, self.opened_at[host] + self.cooldown - time.monotonic())
+
+    def record_success(self, url: str):
+        """
+        Close the circuit of the url's host
+        """
+        host = urlparse(url).netloc
+        self.failures[host] = 0
+        self.opened_at.pop(host, None)
+
+    def record_failure(self, url: str):
+        """
+        Count a failure on the url's host, opening its circuit if there were too many in a row
+        (a failure after the cooldown opens it again straight away)
+        """
+        host = urlparse(url).netloc
+        self.failures[host] = self.failures.get(host, 0) + 1
+        if self.failures[host] >= self.failure_threshold:
+            if host not in self.opened_at:
+                print(f"Too many failures on {host}, pausing requests for {self.cooldown}s")
+            self.opened_at[host] = time.monotonic()
@@ -1,24 +1,37 @@
-from playwright.sync_api import sync_playwright, expect
+from playwright.sync_api import sync_playwright, expect, Page
+from playwright.async_api import async_playwright
+from contextlib import contextmanager, asynccontextmanager
+from queue import Queue
+import asyncio
 import pandas as pd
 from typing import List, Dict, Optional
 
 class WebScraper:
-    def __init__(self, headless: bool = True):
+    def __init__(self, headless: bool = True, page: Optional[Page] = None):
         """
         Initialize the scraper
         Args:
             headless: Whether to run browser in headless mode
+            page: Page of an already running browser (e.g. from a BrowserPool) to use instead of launching one
         """
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=headless)
-        self.page = self.browser.new_page()
+        if page is not None:
+            # Borrowed page: the browser belongs to someone else
+            self.playwright = None
+            self.browser = None
+            self.page = page
+        else:
+            self.playwright = sync_playwright().start()
+            self.browser = self.playwright.chromium.launch(headless=headless)
+            self.page = self.browser.new_page()
         
     def __enter__(self):
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.browser.close()
-        self.playwright.stop()
+        # Only close the browser if this scraper launched it
+        if self.browser is not None:
+            self.browser.close()
+            self.playwright.stop()
 
     async def wait_for_load(self):
         """Wait for different load states"""
@@ -112,4 +125,134 @@ class WebScraper:
             elements = self.get_elements(selector)
             results.extend(elements)
             
-        return list({elem['text']: elem for elem in results}.values())  # Remove duplicates
\ No newline at end of file
+        return list({elem['text']: elem for elem in results}.values())  # Remove duplicates
+
+
+class BrowserPool:
+    def __init__(self, size: int = 1, headless: bool = True):
+        """
+        Launch a long-lived browser with a pool of reusable pages, so the browser startup is paid once per run
+        instead of once per scrape
+        Args:
+            size: Number of pages in the pool
+            headless: Whether to run browser in headless mode
+        """
+        self.size = size
+        self.headless = headless
+        self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(headless=headless)
+        self.pages = Queue()
+        for _ in range(size):
+            self.pages.put(self.browser.new_page())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the browser and every page in the pool
+        """
+        self.browser.close()
+        self.playwright.stop()
+
+    def relaunch(self) -> Page:
+        """
+        Launch a new browser after the current one died (crashed or killed), replacing every page in the pool
+        Returns:
+            Page of the new browser for the caller whose page was lost, the other ones are back in the pool
+        """
+        print("The browser disconnected, launching a new one")
+        self.browser = self.playwright.chromium.launch(headless=self.headless)
+        while not self.pages.empty():
+            self.pages.get_nowait()
+        for _ in range(self.size - 1):
+            self.pages.put(self.browser.new_page())
+        return self.browser.new_page()
+
+    @contextmanager
+    def scraper(self):
+        """
+        Borrow a page from the pool as a WebScraper, returning it to the pool afterwards
+        (the sync API is not thread-safe, so a pool must only be used from the thread that created it)
+        Returns:
+            WebScraper using a pooled page
+        """
+        page = self.pages.get()
+        try:
+            yield WebScraper(page=page)
+        except Exception:
+            # The page may be left in a broken state (crashed, stuck navigation...), so replace it
+            try:
+                page.close()
+            except Exception:
+                # Closing a crashed page can fail too, it is dropped either way
+                pass
+            if self.browser.is_connected():
+                page = self.browser.new_page()
+            else:
+                # Every page went down with the browser
+                page = self.relaunch()
+            raise
+        finally:
+            self.pages.put(page)
+
+
+class AsyncBrowserPool:
+    def __init__(self, size: int = 4, headless: bool = True):
+        """
+        Same as BrowserPool, with the Playwright async API: the pages can load at the same time
+        (start it with "async with")
+        Args:
+            size: Number of pages in the pool, i.e. the maximum number of pages loading at the same time
+            headless: Whether to run browser in headless mode
+        """
+        self.size = size
+        self.headless = headless
+
+    async def __aenter__(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        self.relaunch_lock = asyncio.Lock()
+        # Pages are kept with the browser they belong to, to spot the ones left over from a browser that died
+        self.pages = asyncio.Queue()
+        for _ in range(self.size):
+            self.pages.put_nowait((await self.browser.new_page(), self.browser))
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.browser.close()
+        await self.playwright.stop()
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        Borrow a page from the pool (waiting for one to be free), returning it to the pool afterwards
+        Returns:
+            Async API page
+        """
+        page, browser = await self.pages.get()
+        if browser is not self.browser:
+            # Page of a browser that died
+            page, browser = await self.browser.new_page(), self.browser
+        try:
+            yield page
+        except Exception:
+            async with self.relaunch_lock:
+                # Several scrapes can notice the same dead browser, only the first one launches a new browser
+                if browser is self.browser and not self.browser.is_connected():
+                    print("The browser disconnected, launching a new one")
+                    self.browser = await self.playwright.chromium.launch(headless=self.headless)
+            if browser is self.browser:
+                # The page may be left in a broken state, so replace it
+                try:
+                    await page.close()
+                except Exception:
+                    # Closing a crashed page can fail too, it is dropped either way
+                    pass
+            page, browser = await self.browser.new_page(), self.browser
+            raise
+        finally:
+            self.pages.put_nowait((page, browser))
@@ -1,81 +1,307 @@
 from classes.PrtsScrapper import PrtsScrapper
 from classes.PrtsScrapperCharacter import PrtsScrapperCharacter
+from classes.WebScraper import BrowserPool, AsyncBrowserPool
+from classes.RateLimiter import HostRateLimiter
+from classes.DatasetCheckpoint import DatasetCheckpoint
+from classes.RetryPolicy import RetryPolicy, CircuitBreaker
+import argparse
+import asyncio
 import json
+import requests
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from random import randint
 import os
 
+
+def failure_record(name, url, attempts, error):
+    """
+    Entry of the failure report for an operator that could not be scraped
+    """
+    return {
+        "name": name,
+        "url": url,
+        "attempts": attempts,
+        "error": error,
+        "time": str(datetime.now())
+    }
+
+
+def scrape_sync(operator_pages, num_operators, retry_policy, breaker, on_scraped=None):
+    """
+    Scrape the operators one at a time, with a random pause between them.
+    Failed scrapes are retried with backoff up to the policy's attempt limit, then recorded as failures.
+    on_scraped is called with the details of each operator as soon as it is scraped.
+    Returns the scraped operators and the failure records
+    """
+    # Launch a single browser for the whole run, whose page is reused by every operator scrape
+    with BrowserPool() as browser_pool:
+        # Keep track of operator details in a list of dictionaries
+        operators_list = list()
+
+        # List to keep track of failed scrapes
+        failed_list = list()
+
+        counter = 1
+
+        for name in operator_pages:
+            name_cn = operator_pages[name]["name_cn"]
+            url = operator_pages[name]["url"]
+            print(f"{counter} / {num_operators}: {name}, {datetime.now()}")
+
+            for attempt in range(1, retry_policy.max_attempts + 1):
+                # Wait for the host to recover if it failed too many times in a row
+                time.sleep(breaker.wait_time(url))
+                try:
+                    # Scrape operator
+                    operator = PrtsScrapperCharacter(name, name_cn, url, browser_pool)
+                # Use the except to record failed scrape
+                except Exception as e:
+                    breaker.record_failure(url)
+                    error = repr(e)
+                    print(f"FAILED {name} (attempt {attempt} / {retry_policy.max_attempts}): {error}, {datetime.now()}")
+                    if attempt < retry_policy.max_attempts:
+                        time.sleep(retry_policy.delay(attempt))
+                    continue
+
+                breaker.record_success(url)
+                # Entry for this operator
+                operators_list.append(operator.operator_details)
+                if on_scraped is not None:
+                    on_scraped(operator.operator_details)
+                break
+            # Out of attempts
+            else:
+                failed_list.append(failure_record(name, url, retry_policy.max_attempts, error))
+
+            counter += 1
+
+            time.sleep(randint(3, 10))
+
+    return operators_list, failed_list
+
+
+async def scrape_operator_async(name, operator_pages, browser_pool, rate_limiter):
+    """
+    Scrape a single operator with a page from the pool, once the rate limiter allows a request to its host
+    """
+    name_cn = operator_pages[name]["name_cn"]
+    url = operator_pages[name]["url"]
+    async with browser_pool.page() as page:
+        await rate_limiter.acquire(url)
+        operator = PrtsScrapperCharacter(name, name_cn, url, load=False)
+        return await operator.load_operator_details_async(page)
+
+
+async def scrape_async(operator_pages, num_operators, concurrency, rate, retry_policy, breaker, on_scraped=None):
+    """
+    Scrape up to concurrency operators at the same time, starting at most rate pages per second on each host.
+    Failed scrapes are retried with backoff up to the policy's attempt limit, then recorded as failures.
+    on_scraped is called with the details of each operator as soon as it is scraped.
+    Returns the scraped operators and the failure records
+    """
+    rate_limiter = HostRateLimiter(rate)
+    operators_list = list()
+    failed_list = list()
+    counter = 1
+
+    async with AsyncBrowserPool(concurrency) as browser_pool:
+        async def scrape(name):
+            nonlocal counter
+            url = operator_pages[name]["url"]
+            for attempt in range(1, retry_policy.max_attempts + 1):
+                # Wait for the host to recover if it failed too many times in a row
+                await asyncio.sleep(breaker.wait_time(url))
+                try:
+                    operator_details = await scrape_operator_async(name, operator_pages, browser_pool, rate_limiter)
+                # Use the except to record failed scrape
+                except Exception as e:
+                    breaker.record_failure(url)
+                    error = repr(e)
+                    print(f"FAILED {name} (attempt {attempt} / {retry_policy.max_attempts}): {error}, {datetime.now()}")
+                    # The page goes back to the pool while waiting
+                    if attempt < retry_policy.max_attempts:
+                        await asyncio.sleep(retry_policy.delay(attempt))
+                    continue
+
+                breaker.record_success(url)
+                print(f"{counter} / {num_operators}: {name}, {datetime.now()}")
+                counter += 1
+                operators_list.append(operator_details)
+                if on_scraped is not None:
+                    on_scraped(operator_details)
+                return
+
+            # Out of attempts
+            failed_list.append(failure_record(name, url, retry_policy.max_attempts, error))
+
+        await asyncio.gather(*(scrape(name) for name in operator_pages))
+
+    return operators_list, failed_list
+
+
+def select_changed_operators(scrapper, operator_pages, dataset, revisions):
+    """
+    Pick the operators to scrape in incremental mode: new operators, operators whose page was edited since they were
+    scraped, and operators with a new skin art (which can be uploaded before their page is edited)
+    """
+    existing = {operator["original_name"]: operator for operator in dataset}
+    changed = list()
+    unchanged = list()
+    for name in operator_pages:
+        operator = existing.get(name)
+        # Records without a revision (scraped before revisions were kept) are scraped again
+        if operator is None or operator.get("revision") is None or operator["revision"] != revisions.get(name):
+            changed.append(name)
+        else:
+            unchanged.append(name)
+
+    # Check if the art of the next skin exists for the unchanged operators
+    next_skin_files = {
+        f"立绘_{operator_pages[name]['name_cn']}_skin{len(existing[name]['skins']) + 1}.png": name
+        for name in unchanged
+    }
+    try:
+        existing_files = scrapper.get_existing_files(list(next_skin_files))
+    except requests.RequestException as e:
+        # The unchanged operators keep their skins until their page is edited or the next refresh finds the art
+        print(f"Could not check for new skin art: {e}")
+        existing_files = list()
+    for filename in existing_files:
+        changed.append(next_skin_files[filename])
+
+    return changed
+
+
+def merge_dataset(operator_pages, dataset, scraped_list):
+    """
+    Merge the newly scraped operators into the existing dataset, following the order of the operator list.
+    Operators no longer listed are dropped.
+    """
+    existing = {operator["original_name"]: operator for operator in dataset}
+    scraped = {operator["original_name"]: operator for operator in scraped_list}
+    merged = list()
+    for name in operator_pages:
+        if name in scraped:
+            merged.append(scraped[name])
+        elif name in existing:
+            merged.append(existing[name])
+    return merged
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the operators dataset from PRTS.")
+    parser.add_argument(
+        "--mode", choices=("sync", "async"), default="sync",
+        help="Scrape one operator at a time (sync) or several at the same time (async)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4,
+        help="Pages loading at the same time in async mode"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0.15,
+        help="Pages started per second on each host in async mode (the default is close to the sync mode's pauses)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only scrape new operators and the ones whose page or skins changed, merging them into the existing dataset"
+    )
+    parser.add_argument(
+        "--fresh", action="store_true",
+        help="Discard the checkpoint of an interrupted run instead of resuming it"
+    )
+    parser.add_argument(
+        "--max-attempts", type=int, default=4,
+        help="Attempts per operator before it is recorded as failed"
+    )
+    parser.add_argument(
+        "--backoff-base", type=float, default=5,
+        help="Maximum delay (seconds) after the first failed attempt, doubled after every other one"
+    )
+    parser.add_argument(
+        "--backoff-max", type=float, default=300,
+        help="Cap on the delay (seconds) between attempts"
+    )
+    parser.add_argument(
+        "--breaker-threshold", type=int, default=5,
+        help="Consecutive failures on a host that pause every request to it"
+    )
+    parser.add_argument(
+        "--breaker-cooldown", type=float, default=300,
+        help="Seconds requests to a failing host are paused for"
+    )
+    args = parser.parse_args()
+    if args.max_attempts < 1:
+        parser.error("--max-attempts must be at least 1")
+
     # Base path to write to
     out_path = os.path.join(os.getcwd(), "static", "data")
 
     # Initialize class to scrape list of existing operators
     scrapper = PrtsScrapper()
-    num_operators = scrapper.num_operators_available
     operator_pages = scrapper.operators_url_dict
 
-    
+
     with open(os.path.join(out_path, "operators_list.json"), "w") as f:
         json.dump(operator_pages, f, indent=4, ensure_ascii=False)
 
 
-    # Keep track of operator details in a list of dictionaries
-    operators_list = list()
+    # Current revision of each operator page, kept in the dataset to detect changes in the next incremental refresh
+    try:
+        revisions = scrapper.get_page_revisions(list(operator_pages))
+    except requests.RequestException as e:
+        # Without revisions, an incremental refresh scrapes every operator again
+        print(f"Could not get the page revisions: {e}")
+        revisions = dict()
+
+    # The existing dataset is also loaded for full scrapes: operators that fail keep their previous details
+    dataset = list()
+    if os.path.exists(os.path.join(out_path, "dataset.json")):
+        with open(os.path.join(out_path, "dataset.json"), "r") as f:
+            dataset = json.load(f)
 
-    # List to keep track of failed scrapes
+    if args.incremental and len(dataset) > 0:
+        changed = select_changed_operators(scrapper, operator_pages, dataset, revisions)
+        print(f"{len(changed)} new or changed operators out of {len(operator_pages)}: {changed}")
+        pages_to_scrape = {name: operator_pages[name] for name in changed}
+    else:
+        pages_to_scrape = operator_pages
+
+    # Every scraped operator is committed to the checkpoint right away, so an interrupted run can be resumed
+    checkpoint = DatasetCheckpoint(os.path.join(out_path, "dataset.checkpoint.jsonl"))
+    if args.fresh:
+        checkpoint.clear()
+    resumed = [name for name in pages_to_scrape if name in checkpoint.records]
+    if len(resumed) > 0:
+        print(f"Resuming from the checkpoint: {len(resumed)} operators already scraped")
+    pages_to_scrape = {name: page for name, page in pages_to_scrape.items() if name not in checkpoint.records}
+
+    def on_scraped(operator_details):
+        operator_details["revision"] = revisions.get(operator_details["original_name"])
+        checkpoint.commit(operator_details)
+
+    retry_policy = RetryPolicy(args.max_attempts, args.backoff_base, args.backoff_max)
+    breaker = CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
     failed_list = list()
+    if len(pages_to_scrape) == 0:
+        print("Nothing to scrape")
+    elif args.mode == "async":
+        _, failed_list = asyncio.run(scrape_async(
+            pages_to_scrape, len(pages_to_scrape), args.concurrency, args.rate, retry_policy, breaker, on_scraped
+        ))
+    else:
+        _, failed_list = scrape_sync(pages_to_scrape, len(pages_to_scrape), retry_policy, breaker, on_scraped)
 
-    counter = 1
+    # Report the operators that could not be scraped (they keep their previous details, if any)
+    report_path = os.path.join(out_path, "scrape_failures.json")
+    if len(failed_list) > 0:
+        print(f"{len(failed_list)} operators failed, see {report_path}: {[failure['name'] for failure in failed_list]}")
+        with open(report_path, "w") as f:
+            json.dump(failed_list, f, indent=4, ensure_ascii=False)
+    elif os.path.exists(report_path):
+        os.remove(report_path)
 
-    for name in operator_pages:
-        name_cn = operator_pages[name]["name_cn"]
-        url = operator_pages[name]["url"]
-        print(f"{counter} / {num_operators}: {name}, {datetime.now()}")
-
-        try:
-            # Scrape operator
-            operator = PrtsScrapperCharacter(name, name_cn, url)
-            # Use translated name to account for russian characters
-            translated_name = operator.name_translated
-            # Entry for this operator
-            operators_list.append(operator.operator_details)
-
-        # Use the except to record failed scrape
-        except:
-            print(f"FAILED {name}, {datetime.now()}")
-            failed_list.append(name)
-            time.sleep(60)
-
-        counter += 1
-
-        time.sleep(randint(3, 10))
-
-    # Loop while there are no failed operators
-    print()
-    while len(failed_list) > 0:
-        print(f"{len(failed_list)} fails remain, {datetime.now()}")
-        # Always take the first operator from the list
-        name = failed_list[0]
-        name_cn = operator_pages[name]["name_cn"]
-        url = operator_pages[name]["url"]
-
-        try:
-            print(f"REPEAT {name} from {len(failed_list)} fails, {datetime.now()}")
-            operator = PrtsScrapperCharacter(name, name_cn, url)
-            translated_name = operator.name_translated
-            operators_list.append(operator.operator_details)
-        except:
-            print(f"REPEAT FAIL {name}, {datetime.now()}")
-            continue
-        
-        # If scrape successful, then delete it from the list
-        del failed_list[0]
-
-        time.sleep(60)
-
-
-
-    with open(os.path.join(out_path, "dataset.json"), "w") as f:
-        json.dump(operators_list, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+    # Compact the checkpoint into the final dataset
+    operators_list = merge_dataset(operator_pages, dataset, list(checkpoint.records.values()))
+    checkpoint.compact(os.path.join(out_path, "dataset.json"), operators_list)
@@ -3,8 +3,22 @@ import streamlit as st
 import pandas as pd
 import json
 import os
-import wallpaper_gen
+import threading
+import time
 import utils
+import layout
+import backgrounds
+import metrics
+import render_cache
+import render_scheduler
+from operator_registry import OperatorRegistry
+
+# Width of the quick preview shown while the full wallpaper is rendered (same aspect ratio as the wallpaper)
+PREVIEW_WIDTH = 160
+# Encoder of the wallpaper offered for download (one of utils.ENCODERS)
+WALLPAPER_FORMAT = "PNG"
+# Shown instead of the wallpaper when its render is shed
+SERVER_BUSY_MESSAGE = "The server is busy right now, please try again in a few seconds."
 
 st.markdown("""
 # Arknights Phone Wallpaper Generator
@@ -36,10 +50,35 @@ def load_skins_json():
     return data
 
 
+@st.cache_resource
+def load_operator_registry() -> OperatorRegistry:
+    """Load the operator dataset and its indexes.
+    Cached as a resource so it is only loaded once per process, not on every rerun.
+    """
+    return OperatorRegistry(os.path.join(os.getcwd(), "static", "data", "dataset.json"))
+
+
+@st.cache_resource
+def load_backgrounds() -> None:
+    """Decode the built-in backgrounds for every resolution offered (and their previews) once per process.
+    """
+    resolutions = list(layout.DEVICE_RESOLUTIONS.values())
+    backgrounds.preload_backgrounds(
+        resolutions + [layout.scale_to_width(dimensions, PREVIEW_WIDTH) for dimensions in resolutions]
+    )
+
+
+@st.cache_resource
+def start_metrics() -> None:
+    """Start the render stage metrics exporters configured through the environment, once per process.
+    """
+    metrics.start_from_env()
+
+
 # Load dataset
-json_path = os.path.join(os.getcwd(), "static", "data", "dataset.json")
-dataset = pd.read_json(json_path)
-dataset.sort_values(by="name_translated", inplace=True)
+registry = load_operator_registry()
+load_backgrounds()
+start_metrics()
 
 # Dropdown to filter by operator rank
 operator_rank = st.selectbox(
@@ -48,26 +87,17 @@ operator_rank = st.selectbox(
 )
 
 # Filter the data by operator rank
-for star in range(1, 7):
-    star = str(star)
-    option = star + "-star"
-    # Since the dropdown is single-choice only, this will only match a single\
-    # rank at any point in time
-    if operator_rank == option:
-        filtered_data = dataset[dataset["rarity"] == int(star)]
-
 operator_rank_int = int(operator_rank[0])
-filtered_data = dataset.query(f"rarity == {operator_rank_int}")
+filtered_names = registry.names_by_rarity(operator_rank_int)
 
 # Dropdown to choose the operator
 operator_chosen = st.selectbox(
     "Choose your operator",
-    filtered_data["name_translated"].to_numpy()
+    filtered_names
 )
 
 # Get data for the chosen operator (as a dictionary)
-chosen_op_data = dataset[dataset["name_translated"] == operator_chosen]
-chosen_op_dict = chosen_op_data.to_dict("records")[0]
+chosen_op_dict = registry.get(operator_chosen)
 
 operator_name = chosen_op_dict["name_translated"]
 operator_rank = chosen_op_dict["rarity"]
@@ -107,17 +137,28 @@ custom_bg_img = st.file_uploader(
     "You can upload a custom background image to replace the default black one with 640x1280 dimensions (otherwise it is resized)", 
     type=["png", "jpg"]
 )
-# Save the uploaded image (deleted from the server at the end of the script)
-if custom_bg_img != None:
-    custom_bg_name = "custom_bg_img.png"
-    custom_bg_path = os.path.join("static", "resources", custom_bg_name)
-    pil_custom_bg_img = Image.open(custom_bg_img).resize((640, 1280)).save(custom_bg_path)
 
 # Change the operator theme color
 # Using the beta version until the generally available version is fixed in Streamlit 
 #custom_op_color = st.color_picker("Feel free to change the operator theme color", op_default_color)
 custom_op_color = st.color_picker("Feel free to change the operator theme color", op_default_color)
 
+# Choose the output resolution of the wallpaper
+resolution_chosen = st.selectbox(
+    "Choose the wallpaper resolution",
+    list(layout.DEVICE_RESOLUTIONS.keys())
+)
+wallpaper_dims = layout.DEVICE_RESOLUTIONS[resolution_chosen]
+
+# Decode the uploaded image in memory, straight to the wallpaper dimensions
+# (it is private to this session and never written to disk)
+if custom_bg_img != None:
+    try:
+        pil_custom_bg_img = utils.load_custom_bg(custom_bg_img.getvalue(), wallpaper_dims)
+    except (ValueError, OSError, Image.DecompressionBombError) as e:
+        st.error(f"Couldn't use the uploaded background: {e}")
+        custom_bg_img = None
+
 # Put together relevant operator information in a single dictionary
 operator_info = {
     "Elite 0": e0_art,
@@ -133,29 +174,76 @@ fg_art_url = utils.get_art_url(foreground_art, operator_info)
 bg_art_url = utils.get_art_url(background_art, operator_info)
 
 # Create the image name string
-wallpaper_name = operator_name + ".png"
-wallpaper_bg_path = custom_bg_path if custom_bg_img != None else ""
-
-# Generate the wallpaper
-wallpaper_gen.generate(
-    wallpaper_name,
-    fg_art_url,
-    bg_art_url,
-    wallpaper_bg_path,
-    custom_op_color
-)
-# Display the wallpaper
-st.image(wallpaper_name, use_container_width=True)
+pil_format = utils.get_encoder(WALLPAPER_FORMAT)[0]
+wallpaper_name = operator_name + utils.FILE_EXTENSIONS[pil_format]
+wallpaper_bg = pil_custom_bg_img if custom_bg_img != None else ""
 
-# Encode the image to bytes so a download link can be created
-encoded_img = utils.encode_img_to_b64(wallpaper_name)
-href = f'<a href="data:image/png;base64,{encoded_img}" download="{wallpaper_name}">Download the graphic</a>'
-# Create the download link
-st.markdown(href, unsafe_allow_html=True)
+wallpaper_args = (fg_art_url, bg_art_url, wallpaper_bg, custom_op_color, WALLPAPER_FORMAT)
+wallpaper_placeholder = st.empty()
+render_status = st.empty()
 
-# Delete the graphic from the server
-os.remove(wallpaper_name)
+# Generate the full wallpaper in the background (encoded once, in memory, and shared between sessions)
+full_is_cached = render_cache.is_cached(*wallpaper_args, dimensions=wallpaper_dims)
+render_cancelled = threading.Event()
 try:
-    os.remove(custom_bg_path)
-except:
-    pass
\ No newline at end of file
+    render_job = render_cache.submit_render_cached(
+        *wallpaper_args,
+        dimensions=wallpaper_dims,
+        is_cancelled=render_cancelled.is_set
+    )
+except render_scheduler.RenderRejected:
+    # Too many renders waiting already: shed this one instead of running out of memory
+    st.warning(SERVER_BUSY_MESSAGE)
+    st.stop()
+# Render a low resolution preview at the same time, unless the full wallpaper is already available
+# (both are made from the same decoded art, and both are abandoned if this run is interrupted)
+preview_job = None
+if not full_is_cached:
+    try:
+        preview_job = render_cache.submit_render_cached(
+            *wallpaper_args,
+            dimensions=layout.scale_to_width(wallpaper_dims, PREVIEW_WIDTH),
+            is_cancelled=render_cancelled.is_set
+        )
+    except render_scheduler.RenderRejected:
+        # The preview is shed like any other render when the server is busy
+        pass
+render_start = time.perf_counter()
+try:
+    while not render_job.done():
+        # Show the preview as soon as it is ready
+        if preview_job is not None and preview_job.done():
+            try:
+                wallpaper_placeholder.image(preview_job.result(), use_container_width=True)
+            except render_scheduler.RenderRejected:
+                # The preview is shed like any other render when the server is busy
+                pass
+            preview_job = None
+        # Sending an element lets Streamlit interrupt this run if a widget changed in the meantime
+        queue_depth = render_scheduler.scheduler.stats()["queue_depth"]
+        render_status.caption(
+            f"Rendering the full resolution wallpaper... {time.perf_counter() - render_start:.1f}s"
+            f" ({queue_depth} renders waiting)"
+        )
+        time.sleep(0.1)
+finally:
+    # If this run was interrupted, its wallpapers are stale: abandon the renders
+    render_cancelled.set()
+render_status.empty()
+try:
+    wallpaper_bytes = render_job.result()
+except render_scheduler.RenderRejected:
+    # The render waited too long to start
+    st.warning(SERVER_BUSY_MESSAGE)
+    st.stop()
+
+# Display the wallpaper
+wallpaper_placeholder.image(wallpaper_bytes, use_container_width=True)
+
+# Serve the same bytes for the download
+st.download_button(
+    "Download the graphic",
+    data=wallpaper_bytes,
+    file_name=wallpaper_name,
+    mime=utils.MIME_TYPES[pil_format]
+)
@@ -1,9 +1,45 @@
+from functools import lru_cache
 from io import BytesIO
-import os
-from PIL import Image, ImageEnhance, ImageDraw
+from PIL import Image, ImageColor, ImageDraw, ImageOps, ExifTags
 from typing import List, Dict, Tuple
-import base64
+import hashlib
+import os
+import numpy as np
 import streamlit as st
+import art_cache
+from bounded_cache import BoundedCache
+import metrics
+from layout import get_layout
+
+# Filter used for the single resample of each art (Pillow's default for RGBA images)
+RESAMPLE_FILTER = Image.Resampling.BICUBIC
+# Largest custom background accepted (in pixels), to refuse decompression bombs
+CUSTOM_BG_MAX_PIXELS = 50_000_000
+# Number of prepared custom backgrounds kept in memory (by content hash and dimensions)
+CUSTOM_BG_CACHE_SIZE = 16
+# Image info entry holding the content hash of a prepared custom background
+CUSTOM_BG_HASH_KEY = "custom_bg_hash"
+# Prepared custom backgrounds, each counting as one entry
+custom_bg_cache = BoundedCache(CUSTOM_BG_CACHE_SIZE)
+# Output encoders: name -> (PIL image format, save options). Any other PIL format name can be used too,
+# with Pillow's default options
+ENCODERS = {
+    # Pillow's defaults (zlib level 6)
+    "PNG": ("PNG", {}),
+    # Fastest PNG encode, bigger file
+    "PNG-fast": ("PNG", {"compress_level": 1}),
+    # Smallest PNG, slowest encode
+    "PNG-small": ("PNG", {"compress_level": 9}),
+    # Lossless, about a third smaller than PNG in the same encode time (quality is the compression effort
+    # when lossless, and higher efforts only shave a few more percent at several times the cost)
+    "WEBP-lossless": ("WEBP", {"lossless": True, "quality": 25, "method": 1}),
+    # Lossy, without chroma subsampling so the footer and shadow edges stay sharp
+    "JPEG": ("JPEG", {"quality": 92, "subsampling": 0}),
+}
+# MIME type of each output image format
+MIME_TYPES = {"PNG": "image/png", "WEBP": "image/webp", "JPEG": "image/jpeg"}
+# File extension of each output image format
+FILE_EXTENSIONS = {"PNG": ".png", "WEBP": ".webp", "JPEG": ".jpg"}
 
 
 def get_art_url(selected_art: str, operator_info: Dict) -> str:
@@ -37,42 +73,71 @@ def create_avail_art_options(
     return art_choices
 
 
+def opacity_table(opacity: float) -> List[int]:
+    """Lookup table scaling an alpha channel to the given opacity level.
+    The table matches ImageEnhance.Brightness exactly (single precision float, truncated).
+    """
+    return np.clip(np.arange(256, dtype=np.float32) * np.float32(opacity), 0, 255).astype(np.uint8).tolist()
+
+
 def change_alpha(img: Image.Image, opacity: float) -> Image.Image:
     """Change the opacity of an image.
     # https://gist.github.com/blippy/a385dc77f9d74e4876d5
     """
-    # Get the alpha channel
-    alpha = img.getchannel("A")
-    # Adjust the brightness of the alpha channel to the desired opacity level
-    alpha = ImageEnhance.Brightness(alpha).enhance(opacity)
-    # Instead of changing the image's alpha channel value, update it with\
-    # an already transformed image channel
-    img.putalpha(alpha)
+    with metrics.stage("alpha"):
+        # Get the alpha channel
+        alpha = img.getchannel("A")
+        # Scale the alpha channel to the desired opacity level through a lookup table
+        alpha = alpha.point(opacity_table(opacity))
+        # Instead of changing the image's alpha channel value, update it with\
+        # an already transformed image channel
+        img.putalpha(alpha)
 
     return img
 
 
-def resize_img(img: Image.Image, factor: float) -> Image.Image:
-    """Resize an image.
+def resize_img(img: Image.Image, art_size: int) -> Image.Image:
+    """Resize an image to a square of the given size, in a single resample.
     """
-    # Make sure the image is in the default dimensions and is RGBA
-    img = img.resize((1024, 1024)).convert("RGBA")
+    img_dims = [art_size, art_size]
 
-    # Calculate new dimensions
-    img_dims = img.size
-    img_dims = [int(dim*factor) for dim in img_dims]
-
-    # Finally resize the image, keeping it RGBA
-    img = img.resize(img_dims).convert("RGBA")
+    # Resize the image only once, keeping it RGBA
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    if list(img.size) != img_dims:
+        img = img.resize(img_dims, RESAMPLE_FILTER)
 
     return img
 
 
+def decode_art(art_bytes: bytes) -> Image.Image:
+    """Decode the downloaded art.
+    """
+    with metrics.stage("decode"):
+        art = Image.open(BytesIO(art_bytes), mode="r")
+        # Decode now, so the resize stage only times the resample
+        art.load()
+    return art
+
+
+def load_source_art(art_url: str) -> Image.Image:
+    """Get the decoded source art, only downloading and decoding it if it is not cached in memory.
+    Every layer made from the same art (fore/background, preview and full resolution) is resampled from this
+    single decode, even when they are loaded at the same time.
+    """
+    def fetch_and_decode():
+        with metrics.stage("fetch"):
+            art_bytes = art_cache.fetch_art(art_url)
+        return (decode_art(art_bytes), None)
+
+    return art_cache.layer_cache.get_or_create((art_url, "source", None, None), fetch_and_decode)[0]
+
+
 def calculate_bg_coordinates(bg_art: Image.Image, wip_img_dims: List[int]) -> List[int]:
     """Calculate the coordinates at which to draw the background image.
     """
-    # Lis of coordinates (the Y/height coordinate won't change)
-    bg_coords = [None, -100]
+    # Lis of coordinates (the Y/height coordinate only depends on the layout)
+    bg_coords = [None, get_layout(wip_img_dims).bg_art_y]
     # The X/width coordinate is horizontally-aligned
     bg_art_dims = bg_art.size
     bg_coords[0] = (wip_img_dims[0] - bg_art_dims[0]) // 2
@@ -107,33 +172,46 @@ def calculate_centered_coordinates(art: Image.Image, wip_img_dims: List[int]) ->
     return art_coords
 
 
-def prepare_loaded_bg_art(res, img_dimensions, alpha):
-    """Load the background art after making a GET request to it, process it and calculate the coordinates at which to draw it.
+def trim_layer(art: Image.Image, art_coords: List[int]) -> Tuple[Image.Image, List[int]]:
+    """Crop an art layer to the bounding box of its visible (non-transparent) pixels and move its coordinates to match.
+    Fully transparent pixels leave the wallpaper untouched when pasted, so the trimmed layer draws exactly the same
+    pixels while the compositing (and the layer's memory) scales with the visible area only.
+    """
+    with metrics.stage("trim"):
+        bbox = art.getchannel("A").getbbox()
+        # Keep a single (transparent) pixel of fully transparent art
+        if bbox is None:
+            bbox = (0, 0, 1, 1)
+        art = art.crop(bbox)
+    art_coords = [art_coords[0] + bbox[0], art_coords[1] + bbox[1]]
+    return (art, art_coords)
+
+
+def prepare_loaded_bg_art(source_art: Image.Image, img_dimensions, alpha):
+    """Process the decoded background art and calculate the coordinates at which to draw it.
     """
-    # Load the art from the request and process it
-    art = Image\
-        .open(BytesIO(res.content), mode="r")\
-        .convert("RGBA")\
-        .resize((1024, 1024))
+    # Resize the art to its final dimensions
+    with metrics.stage("resize"):
+        art = resize_img(source_art, get_layout(img_dimensions).bg_art_size)
+    # The source art is shared, so never change its opacity in place
+    if art is source_art:
+        art = art.copy()
 
     # Change the image's opacity
     art = change_alpha(art, alpha)
-    # Resize the image
-    art = resize_img(art, 1.05)
     # Center the BG art horizontally
     art_coords = calculate_bg_coordinates(art, img_dimensions)
 
-    return (art, art_coords)
+    # Drop the transparent padding around the art
+    return trim_layer(art, art_coords)
 
 
-def prepare_loaded_art(res, img_dimensions, art_type: str):
-    """Load the art after making a GET request to it, process it and calculate the coordinates at which to draw it.
+def prepare_loaded_art(source_art: Image.Image, img_dimensions, art_type: str):
+    """Process the decoded art and calculate the coordinates at which to draw it.
     """
-    # Load the art from the request and process it
-    art = Image\
-        .open(BytesIO(res.content), mode="r")\
-        .convert("RGBA")\
-        .resize((1024, 1024))
+    # Resize the art to its final dimensions
+    with metrics.stage("resize"):
+        art = resize_img(source_art, get_layout(img_dimensions).art_size)
 
     # Center the art if it's the only art used
     if art_type == "single":
@@ -145,7 +223,90 @@ def prepare_loaded_art(res, img_dimensions, art_type: str):
     else:
         art_coords = calculate_foreground_coordinates(art, img_dimensions)
 
-    return (art, art_coords)
+    # Drop the transparent padding around the art
+    return trim_layer(art, art_coords)
+
+
+def load_bg_art_layer(art_url: str, img_dimensions, alpha: float) -> Tuple[Image.Image, List[int]]:
+    """Get the processed background art layer (trimmed to its visible pixels) and its coordinates, only decoding
+    and resizing it if it is not cached in memory.
+    """
+    cache_key = (art_url, "background", alpha, tuple(img_dimensions))
+    return art_cache.layer_cache.get_or_create(
+        cache_key, lambda: prepare_loaded_bg_art(load_source_art(art_url), img_dimensions, alpha)
+    )
+
+
+def load_art_layer(art_url: str, img_dimensions, art_type: str) -> Tuple[Image.Image, List[int]]:
+    """Get the processed art layer (trimmed to its visible pixels) and its coordinates, only decoding and resizing
+    it if it is not cached in memory.
+    """
+    cache_key = (art_url, art_type, None, tuple(img_dimensions))
+    return art_cache.layer_cache.get_or_create(
+        cache_key, lambda: prepare_loaded_art(load_source_art(art_url), img_dimensions, art_type)
+    )
+
+
+def fit_box(img_size: Tuple[int, int], dimensions: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """Calculate the centered region of an image with the aspect ratio of the given dimensions, as large as possible.
+    Resizing that region to the dimensions makes the image cover them without distortion.
+    """
+    width, height = img_size
+    target_ratio = dimensions[0] / dimensions[1]
+    if width / height > target_ratio:
+        # Too wide: crop the sides
+        crop_width = height * target_ratio
+        left = (width - crop_width) / 2
+        return (left, 0, left + crop_width, height)
+    # Too tall: crop the top and bottom
+    crop_height = width / target_ratio
+    top = (height - crop_height) / 2
+    return (0, top, width, top + crop_height)
+
+
+def prepare_custom_bg(img_bytes: bytes, dimensions: Tuple[int, int]) -> Image.Image:
+    """Decode an uploaded background image straight to the wallpaper dimensions.
+    JPEGs are decoded at a reduced scale when possible and the resize uses reduce-on-resample, so big phone photos
+    never get fully decoded and resampled at full resolution.
+    """
+    img = Image.open(BytesIO(img_bytes), mode="r")
+    # Only the header was read so far: refuse decompression bombs before decoding anything
+    if img.width * img.height > CUSTOM_BG_MAX_PIXELS:
+        raise ValueError(
+            f"The image is too large ({img.width}x{img.height}), the maximum is {CUSTOM_BG_MAX_PIXELS} pixels"
+        )
+
+    # Let the JPEG decoder scale the image down by up to 8x, while still covering the wallpaper
+    if img.format == "JPEG":
+        # Phone photos can be rotated through their EXIF orientation
+        orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+        rotated = orientation in (5, 6, 7, 8)
+        draft_size = dimensions[::-1] if rotated else dimensions
+        img.draft("RGB", tuple(draft_size))
+    img = ImageOps.exif_transpose(img)
+
+    # Crop and resize in a single resample
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    img = img.resize(dimensions, RESAMPLE_FILTER, box=fit_box(img.size, dimensions), reducing_gap=3.0)
+
+    return img.convert("RGBA")
+
+
+def load_custom_bg(img_bytes: bytes, dimensions: Tuple[int, int]) -> Image.Image:
+    """Get an uploaded background prepared for the given dimensions, only decoding it if it is not cached.
+    The cache is keyed by the hash of the uploaded content, which is also kept in the image info.
+    """
+    dimensions = tuple(dimensions)
+    content_hash = hashlib.sha256(img_bytes).hexdigest()
+
+    def prepare():
+        bg = prepare_custom_bg(img_bytes, dimensions)
+        # Keep the content hash with the image, so the render cache can key it without hashing its pixels
+        bg.info[CUSTOM_BG_HASH_KEY] = f"upload:{content_hash}:{dimensions[0]}x{dimensions[1]}"
+        return bg
+
+    return custom_bg_cache.get_or_create((content_hash, dimensions), prepare)
 
 
 def increment_footer_color(operator_color: str) -> str:
@@ -192,40 +353,64 @@ def increment_footer_color(operator_color: str) -> str:
     return new_color
 
 
-def create_and_paste_footer(img: Image.Image, operator_color: str) -> None:
-    """Draw the footer in a new image and save it, load it, and paste it into the working image.
-    The footer image is deleted at the end of the operation.
-    """
-    # Create a new image for the footer
-    img_dims = img.size
-    footer_img = Image.new("RGBA", img_dims)
-    d = ImageDraw.Draw(footer_img)
+# Alpha of the footer polygon (fully opaque made 70% translucent)
+FOOTER_ALPHA = opacity_table(0.7)[255]
 
-    # Draw the footer polygon
-    footer_coords = [(0, 1100), (640, 1000), (640, 1280), (0, 1280)]
-    footer_color = increment_footer_color(operator_color)
-    d.polygon(footer_coords, fill=footer_color)
 
-    # Save the temporary footer image
-    footer_img_name = "footer.png"
-    footer_img.save(footer_img_name)
+@lru_cache(maxsize=16)
+def create_footer_mask(img_dims: Tuple[int, int]) -> Tuple[Image.Image, List[int]]:
+    """Draw the translucent footer polygon as an L mask, cropped to the polygon, for the given image dimensions.
+    Returns the mask and its drawing coordinates. The result is cached, so it must not be modified in place.
+    """
+    with metrics.stage("footer"):
+        mask = Image.new("L", img_dims)
+        ImageDraw.Draw(mask).polygon(get_layout(img_dims).footer_polygon, fill=FOOTER_ALPHA)
+        bbox = mask.getbbox()
 
-    # Load the footer image
-    footer_img = Image.open(footer_img_name, "r").convert("RGBA")
-    footer_img = change_alpha(footer_img, 0.7)
-    # And paste it into the working image
-    img.paste(footer_img, (0, 0), mask=footer_img)
+    return mask.crop(bbox), [bbox[0], bbox[1]]
 
-    # Delete the footer image at the end
-    os.remove(footer_img_name)
 
+def create_footer(img_dims: Tuple[int, int], operator_color: str) -> Tuple[str, List[int], Image.Image]:
+    """Create the translucent footer layer for the given image dimensions and operator color: a solid color drawn
+    through the (cached) footer mask.
+    """
+    mask, coords = create_footer_mask(tuple(img_dims))
+    # The color is as translucent as the mask, like the pixels of the footer image it replaces
+    footer_color = "#{:02x}{:02x}{:02x}{:02x}".format(
+        *ImageColor.getrgb(increment_footer_color(operator_color))[:3], FOOTER_ALPHA
+    )
+    return footer_color, coords, mask
 
-def encode_img_to_b64(img_name: str) -> bytes:
-    """Given the name of a image file, load it in bytes mode, and convert it to a base 64 bytes object.
+
+def get_encoder(img_format: str) -> Tuple[str, Dict]:
+    """Get the PIL image format and save options of an encoder (one of ENCODERS or a PIL format name).
     """
-    # https://discuss.streamlit.io/t/how-to-download-file-in-streamlit/1806/19
-    with open(img_name, "rb") as f:
-        img = f.read()
-        encoded_img = base64.b64encode(img).decode()
+    if img_format in ENCODERS:
+        pil_format, save_options = ENCODERS[img_format]
+        return (pil_format, dict(save_options))
+    return (img_format.upper(), dict())
+
 
-    return encoded_img
+def save_img(img: Image.Image, fp, img_format: str = None, **save_options) -> None:
+    """Save an image to a file path or file object with one of the encoders (see get_encoder).
+    If no format is given, it is guessed from the file extension. The keyword arguments override the encoder
+    options (e.g. compress_level=3 for PNG or quality=85 for JPEG/WebP).
+    """
+    if img_format is None:
+        extension = os.path.splitext(fp)[1].lower()
+        img_format = Image.registered_extensions()[extension]
+    pil_format, options = get_encoder(img_format)
+    options.update(save_options)
+    # JPEG has no alpha channel (the wallpapers are fully opaque anyway)
+    with metrics.stage("encode"):
+        if pil_format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(fp, format=pil_format, **options)
+
+
+def encode_img(img: Image.Image, img_format: str = "PNG", **save_options) -> bytes:
+    """Encode an image in memory with one of the encoders (see save_img) and return the resulting bytes.
+    """
+    buffer = BytesIO()
+    save_img(img, buffer, img_format, **save_options)
+    return buffer.getvalue()
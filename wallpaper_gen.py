@@ -1,78 +1,268 @@
-from PIL import Image, ImageDraw
-import requests
+from PIL import Image, ImageDraw, ImageOps
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-import os
+from typing import Callable, List, Optional, Tuple, Union
 import utils
+import compositor
+import backgrounds
+import metrics
+from layout import get_layout
 
+# Default output dimensions, any other (width, height) can be passed to the render functions
 DIMENSIONS = (640, 1280)
 ART_ALPHA = 0.8
-SHADOW_OFFSET = 15
 
 
-def generate(
-    img_name: str, 
-    foreground_art: str, 
-    background_art: str,
-    wallpaper_bg: str,
-    operator_color: str
-) -> None:
-    """Given the necessary information, create a wallpaper for the operator using PIL.
+class RenderCancelled(Exception):
+    """Raised when a render is abandoned because its result is no longer needed.
+    """
+
+
+def check_cancelled(is_cancelled: Optional[Callable[[], bool]]) -> None:
+    """Stop the render (by raising RenderCancelled) if it was cancelled.
+    """
+    if is_cancelled is not None and is_cancelled():
+        raise RenderCancelled()
+
+
+# Threads used to download and prepare the fore and background art at the same time
+art_loader = ThreadPoolExecutor(max_workers=4)
+
+
+def load_base(wallpaper_bg: Union[str, Image.Image], dimensions: Tuple[int, int] = DIMENSIONS) -> Image.Image:
+    """Load the base image background: a built-in one (the default if empty), an image file or an image already
+    in memory. Built-in backgrounds come already decoded at the right size, and are shared between renders
+    (the compositor only draws on a copy of the base image).
     """
-    # Create a new RGBA image
-    wip_img = Image.new("RGBA", DIMENSIONS)
+    dimensions = tuple(dimensions)
+    if isinstance(wallpaper_bg, Image.Image):
+        wip_img = wallpaper_bg.convert("RGBA")
+    elif wallpaper_bg == "":
+        wip_img = backgrounds.get_background(backgrounds.DEFAULT_BACKGROUND, dimensions)
+    elif backgrounds.is_background(wallpaper_bg):
+        wip_img = backgrounds.get_background(wallpaper_bg, dimensions)
+    else:
+        wip_img = Image.open(wallpaper_bg, mode="r").convert("RGBA")
+    # Scale and crop the background to cover the whole wallpaper
+    if wip_img.size != dimensions:
+        wip_img = ImageOps.fit(wip_img, dimensions, utils.RESAMPLE_FILTER)
+    return wip_img
+
 
+def submit_art(foreground_art: str, background_art: str, dimensions: Tuple[int, int] = DIMENSIONS) -> Tuple:
+    """Start loading the fore and background art layers (each decoded only if not cached in memory) in the
+    art loader threads, and return their futures (None for a missing background art).
+    """
     # The operator may not have one of the arts, or the user chose to not use them
     ignore_bg_image = (background_art == "")
     ignore_fg_image = (foreground_art == "")
     # Is either of the options not being used?
     using_single_art = any((ignore_bg_image, ignore_fg_image))
 
-    # Load the base image background
-    if wallpaper_bg == "":
-        bg_path = os.path.join("static", "resources", "bg.png")
-    else:
-        bg_path = wallpaper_bg
-    bg = Image.open(bg_path, mode="r").convert("RGBA")
-
     # Load background art if there is one
+    bg_art_job = None
     if ignore_bg_image != True:
-        res = requests.get(background_art)
-        bg_art, bg_art_coords = utils.prepare_loaded_bg_art(res, DIMENSIONS, ART_ALPHA)
+        bg_art_job = art_loader.submit(
+            utils.load_bg_art_layer, background_art, dimensions, ART_ALPHA
+        )
 
-    # Load foreground art if there is one
-    # Load foreground art
-    res = requests.get(foreground_art)
+    # Load foreground art, in parallel with the background art
     # If we are using only foreground art, then center it
     if using_single_art == True:
-        fg_art, fg_art_coords = utils.prepare_loaded_art(res, DIMENSIONS, "single")
+        fg_art_job = art_loader.submit(
+            utils.load_art_layer, foreground_art, dimensions, "single"
+        )
     # Otherwise use the bottom alignment
     else:
-        fg_art, fg_art_coords = utils.prepare_loaded_art(res, DIMENSIONS, "normal")
+        fg_art_job = art_loader.submit(
+            utils.load_art_layer, foreground_art, dimensions, "normal"
+        )
+
+    return (fg_art_job, bg_art_job)
+
+
+def art_result(art_jobs: Tuple) -> Tuple:
+    """Wait for the art layers started by submit_art and return (fg art, fg coords, bg art, bg coords),
+    with None for a missing background art.
+    """
+    fg_art_job, bg_art_job = art_jobs
+    fg_art, fg_art_coords = fg_art_job.result()
+    bg_art, bg_art_coords = (None, None)
+    if bg_art_job is not None:
+        bg_art, bg_art_coords = bg_art_job.result()
+    return (fg_art, fg_art_coords, bg_art, bg_art_coords)
+
+
+def color_layers(
+    art: Tuple,
+    operator_color: str,
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    using_single_art: bool = False
+) -> List[compositor.Layer]:
+    """Create the stack of layers to draw on top of the background, in order, from the loaded art (see art_result).
+    Only the footer and the shadow fills depend on the operator color, the art layers are shared as they are.
+    """
+    dimensions = tuple(dimensions)
+    layout = get_layout(dimensions)
+    fg_art, fg_art_coords, bg_art, bg_art_coords = art
 
-    # Create the foreground art shadow
-    shadow = Image.new("RGBA", fg_art.size, color=operator_color)
     # Calculate the drawing coordinates for the foreground art shadow
-    shadow_coords = [coord+SHADOW_OFFSET for coord in fg_art_coords]
+    shadow_coords = [coord+layout.shadow_offset for coord in fg_art_coords]
 
-    # Add the background
-    wip_img.paste(bg)
-    # Add the colored footer polygon
-    utils.create_and_paste_footer(wip_img, operator_color)
+    # The art shadows are solid operator color layers masked by the art itself
+    layers = list()
+    # Add the colored footer polygon (its mask is cached for each dimensions)
+    layers.append(utils.create_footer(dimensions, operator_color))
     # Add the background art if there is one
-    if ignore_bg_image != True:
+    if bg_art is not None:
         if using_single_art == True:
             # Add the background art shadow
-            wip_img.paste(shadow, shadow_coords, mask=bg_art)
-        wip_img.paste(bg_art, bg_art_coords, mask=bg_art)
+            bg_shadow_coords = [coord+layout.shadow_offset for coord in bg_art_coords]
+            layers.append((operator_color, bg_shadow_coords, bg_art))
+        layers.append((bg_art, bg_art_coords, bg_art))
 
     # Add the foreground art 
     # Add the foreground art shadow
-    wip_img.paste(shadow, shadow_coords, mask=fg_art)
+    layers.append((operator_color, shadow_coords, fg_art))
     # Add the foreground art
-    wip_img.paste(fg_art, fg_art_coords, mask=fg_art)
-    
+    layers.append((fg_art, fg_art_coords, fg_art))
+
+    return layers
+
+
+def build_layers(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> Tuple[Image.Image, List[compositor.Layer]]:
+    """Load everything needed for the operator wallpaper: the base image (with the background) and the stack of
+    layers to draw on top of it.
+    is_cancelled is checked between the expensive stages, and the render stops if it returns True.
+    """
+    dimensions = tuple(dimensions)
+    using_single_art = any((foreground_art == "", background_art == ""))
+
+    art_jobs = submit_art(foreground_art, background_art, dimensions)
+    # Load the background while the art is being loaded
+    with metrics.stage("background"):
+        wip_img = load_base(wallpaper_bg, dimensions)
+    # Wait for both arts to be ready (their fetch, decode and resize are timed as stages of their own)
+    with metrics.stage("art_wait"):
+        art = art_result(art_jobs)
+    check_cancelled(is_cancelled)
+
+    return (wip_img, color_layers(art, operator_color, dimensions, using_single_art))
+
+
+def render(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> Image.Image:
+    """Given the necessary information, create a wallpaper for the operator using PIL and return it.
+    """
+    check_cancelled(is_cancelled)
+    with metrics.stage("render"):
+        wip_img, layers = build_layers(
+            foreground_art, background_art, wallpaper_bg, operator_color, dimensions, is_cancelled
+        )
+        # Draw every layer with the configured compositing engine
+        with metrics.stage("composite"):
+            return compositor.composite(wip_img, layers)
+
+
+def render_bytes(
+    foreground_art: str,
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    img_format: str = "PNG",
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> bytes:
+    """Create a wallpaper for the operator and return it encoded with the given encoder (one of utils.ENCODERS or
+    a PIL format name), without touching the disk.
+    """
+    wip_img = render(foreground_art, background_art, wallpaper_bg, operator_color, dimensions, is_cancelled)
+    check_cancelled(is_cancelled)
+    return utils.encode_img(wip_img, img_format)
+
+
+def generate(
+    img_name: str, 
+    foreground_art: str, 
+    background_art: str,
+    wallpaper_bg: Union[str, Image.Image],
+    operator_color: str,
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    img_format: str = None,
+    **save_options
+) -> None:
+    """Given the necessary information, create a wallpaper for the operator using PIL.
+    The wallpaper is saved with the given encoder (one of utils.ENCODERS or a PIL format name, guessed from the
+    file extension if not given), and the keyword arguments override its options (e.g. compress_level=1).
+    """
+    wip_img = render(foreground_art, background_art, wallpaper_bg, operator_color, dimensions)
     # Save the resulting wallpaper
-    wip_img.save(img_name)
+    utils.save_img(wip_img, img_name, img_format, **save_options)
+
+
+def render_variants(
+    variants: List[Tuple[str, str, str]],
+    wallpaper_bg: Union[str, Image.Image],
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    is_cancelled: Optional[Callable[[], bool]] = None
+) -> List[Image.Image]:
+    """Create several wallpapers that share the same background, given as (foreground art, background art,
+    operator color) variants: e.g. one art in many colors, or the skins of an operator in one color.
+    The background is loaded once and every distinct art once (all at the same time), so each variant only pays
+    for its color layers (footer and shadow fills) and the compositing.
+    """
+    dimensions = tuple(dimensions)
+
+    # Start loading every distinct pair of arts before waiting for any of them
+    art_jobs = dict()
+    for foreground_art, background_art, _ in variants:
+        arts = (foreground_art, background_art)
+        if arts not in art_jobs:
+            art_jobs[arts] = submit_art(foreground_art, background_art, dimensions)
+    with metrics.stage("background"):
+        wip_img = load_base(wallpaper_bg, dimensions)
+    with metrics.stage("art_wait"):
+        art = {arts: art_result(jobs) for arts, jobs in art_jobs.items()}
+
+    wallpapers = list()
+    for foreground_art, background_art, operator_color in variants:
+        check_cancelled(is_cancelled)
+        using_single_art = any((foreground_art == "", background_art == ""))
+        layers = color_layers(art[(foreground_art, background_art)], operator_color, dimensions, using_single_art)
+        with metrics.stage("composite"):
+            wallpapers.append(compositor.composite(wip_img, layers))
+
+    return wallpapers
+
+
+def generate_variants(
+    img_names: List[str],
+    variants: List[Tuple[str, str, str]],
+    wallpaper_bg: Union[str, Image.Image],
+    dimensions: Tuple[int, int] = DIMENSIONS,
+    img_format: str = None,
+    **save_options
+) -> None:
+    """Same as generate, but for several (foreground art, background art, operator color) variants sharing the
+    same background (see render_variants), each saved to the file with the same position in img_names.
+    """
+    if len(img_names) != len(variants):
+        raise ValueError(f"Got {len(img_names)} file names for {len(variants)} variants")
+    for img_name, wip_img in zip(img_names, render_variants(variants, wallpaper_bg, dimensions)):
+        utils.save_img(wip_img, img_name, img_format, **save_options)
 
 
 if __name__ == "__main__":